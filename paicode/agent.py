@@ -1,19 +1,22 @@
 import os
 import json
+import hashlib
+import functools
+import re
 import signal
+import sys
+import sqlite3
+import time
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from rich.prompt import Prompt
 from rich.panel import Panel
 from rich.console import Group
 from rich.text import Text
-from rich.syntax import Syntax
 from rich.box import ROUNDED
 from rich.table import Table
-from . import llm, workspace, ui
-
-from pygments.lexers import get_lexer_for_filename
-from pygments.util import ClassNotFound
+from . import config, llm, workspace, ui
 
 # Try to import prompt_toolkit for better input experience
 try:
@@ -24,33 +27,182 @@ try:
 except ImportError:
     PROMPT_TOOLKIT_AVAILABLE = False
 
-HISTORY_DIR = ".pai_history"
-VALID_COMMANDS = ["MKDIR", "TOUCH", "WRITE", "READ", "RM", "MV", "TREE", "LIST_PATH", "FINISH", "MODIFY", "SEARCH", "MAP_ROOT", "RUN_COMMAND", "DIAGNOSE", "SNIFF_LOGS", "PROFILE"]
+# Prefer orjson (optional) for parsing the LLM's JSON payloads; fall back to the stdlib parser
+try:
+    import orjson
 
-# Global flag for interrupt handling
-_interrupt_requested = False
-_interrupt_lock = threading.Lock()
+    def _json_loads(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson rejects NaN/Infinity and integers wider than 64 bits, which json accepts
+            return json.loads(data)
+except ImportError:
+    _json_loads = json.loads
+
+HISTORY_DIR = ".pai_history"
+_LOG_SEPARATOR = b"\n-------------------\n"
+VALID_COMMANDS = frozenset({"MKDIR", "TOUCH", "WRITE", "READ", "RM", "MV", "TREE", "LIST_PATH", "FINISH", "MODIFY", "SEARCH", "MAP_ROOT", "RUN_COMMAND", "DIAGNOSE", "SNIFF_LOGS", "PROFILE"})
+_CMD_PREFIXES = tuple(cmd + "::" for cmd in VALID_COMMANDS)
+# Classifies a whole plan line in one pass: COMMAND, optionally followed by ::params
+_CMD_RE = re.compile(
+    "(" + "|".join(sorted(VALID_COMMANDS, key=len, reverse=True)) + r")\s*(?:::(.*))?",
+    re.IGNORECASE | re.DOTALL,
+)
+# Matches a "COMMAND::" marker anywhere in free text, case-insensitively
+_CMD_MARKER_RE = re.compile("|".join(re.escape(prefix) for prefix in _CMD_PREFIXES), re.IGNORECASE)
+# Opening code fence line (with optional language tag) and closing fence line of a plan. They are
+# stripped in two steps: in an empty block the closing fence is also the first remaining line
+_FENCE_OPEN_RE = re.compile(r'\A```[^\n]*\n?')
+_FENCE_CLOSE_RE = re.compile(r'(?:\A|\n)[^\S\n]*```[^\S\n]*\Z')
+# Surrounding whitespace of each line plus a leading "* ", "- " or "+ " list marker (when text follows it)
+_MD_LINE_RE = re.compile(r'^[^\S\n]*(?:[*+-] (?![^\S\n]*$))?|[^\S\n]+$', re.MULTILINE)
+# Commands whose output is logged in full by their own branch rather than as a status line
+_DATA_COMMANDS = frozenset({"READ", "TREE", "LIST_PATH", "SEARCH", "MAP_ROOT", "RUN_COMMAND", "DIAGNOSE", "SNIFF_LOGS"})
+
+# Theme styles resolved once, so per-line Text renderables skip Rich's style-name lookup and parse
+_STYLE_PLAN = ui.console.get_style("plan")
+_STYLE_ACTION = ui.console.get_style("action")
+_STYLE_OUTPUT = ui.console.get_style("bright_blue")
+
+# Style and icon for a result, keyed by its status prefix ("Success: ...", "Error: ...", "Warning: ...");
+# prefixes are at most 7 characters, so only the head of the result is inspected
+_RESULT_STYLES = {
+    "Success": (ui.console.get_style("success"), "✓ "),
+    "Error": (ui.console.get_style("error"), "✗ "),
+    "Warning": (ui.console.get_style("warning"), "! "),
+}
+_INFO_RESULT_STYLE = (ui.console.get_style("info"), "i ")
+
+# Maximum number of commands executed from a single plan step
+try:
+    MAX_COMMANDS_PER_STEP = int(os.getenv("PAI_MAX_CMDS_PER_STEP", "15"))
+    # Clamp to a safe range
+    if MAX_COMMANDS_PER_STEP < 1:
+        MAX_COMMANDS_PER_STEP = 1
+    elif MAX_COMMANDS_PER_STEP > 50:
+        MAX_COMMANDS_PER_STEP = 50
+except ValueError:
+    MAX_COMMANDS_PER_STEP = 15
+
+# Single-path filesystem commands, dispatched straight to their workspace helper
+_PATH_COMMAND_HANDLERS = {
+    "MKDIR": workspace.create_directory,
+    "TOUCH": workspace.create_file,
+    "RM": workspace.delete_item,
+}
+
+# Session read cache: normalized path -> (mtime_ns, size, content), oldest entry evicted first.
+# Entries are also dropped whenever the agent writes, modifies, moves or removes the path, so a
+# change that leaves mtime and size untouched (coarse filesystem timestamps) is never served stale
+READ_CACHE_SIZE = 128
+_READ_CACHE: dict[str, tuple[int, int, str]] = {}
+_read_cache_lock = threading.Lock()
+
+# Upper bound on concurrent workers when prefetching a step's leading READ/TREE/LIST_PATH commands
+READ_PREFETCH_WORKERS = 8
+# Commands that only inspect the workspace and may be run ahead of the step's other commands
+_READ_ONLY_COMMANDS = frozenset({"READ", "TREE", "LIST_PATH"})
+
+# Parsed integrity verdicts keyed by a digest of the integrity prompt (oldest entry evicted first);
+# cleared at the start of each session
+INTEGRITY_CACHE_SIZE = 64
+_integrity_cache: dict[str, dict] = {}
+
+# Global flag for interrupt handling; is_set() is a plain read, so the common
+# "no interrupt" check takes no lock
+_interrupt_event = threading.Event()
 
 def request_interrupt():
     """Request interruption of current AI response."""
-    global _interrupt_requested
-    with _interrupt_lock:
-        _interrupt_requested = True
+    _interrupt_event.set()
 
 def check_interrupt():
     """Check if interrupt was requested and reset flag."""
-    global _interrupt_requested
-    with _interrupt_lock:
-        if _interrupt_requested:
-            _interrupt_requested = False
-            return True
-        return False
+    if _interrupt_event.is_set():
+        _interrupt_event.clear()
+        return True
+    return False
 
 def reset_interrupt():
     """Reset interrupt flag."""
-    global _interrupt_requested
-    with _interrupt_lock:
-        _interrupt_requested = False 
+    _interrupt_event.clear()
+
+@functools.lru_cache(maxsize=256)
+def _get_lang_for_filename(ext_or_name: str) -> str:
+    """Resolve the Pygments alias for a file extension (or bare filename), cached per key."""
+    # Imported lazily: Pygments (and rich.syntax) are only needed once a file is actually displayed
+    from pygments.lexers import get_lexer_for_filename
+    from pygments.util import ClassNotFound
+    try:
+        return get_lexer_for_filename(ext_or_name).aliases[0]
+    except ClassNotFound:
+        return "text"
+
+def _read_file_cached(file_path: str) -> str | None:
+    """Like workspace.read_file, but serves unchanged files from memory within a session."""
+    key = os.path.normpath(file_path)
+    try:
+        st = os.stat(os.path.join(workspace.PROJECT_ROOT, file_path))
+    except OSError:
+        _forget_read(file_path)
+        return workspace.read_file(file_path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _read_cache_lock:
+        cached = _READ_CACHE.get(key)
+    if cached is not None and cached[:2] == stamp:
+        return cached[2]
+
+    content = workspace.read_file(file_path)
+    if content is not None:
+        with _read_cache_lock:
+            if key not in _READ_CACHE and len(_READ_CACHE) >= READ_CACHE_SIZE:
+                _READ_CACHE.pop(next(iter(_READ_CACHE)))
+            _READ_CACHE[key] = (*stamp, content)
+    return content
+
+def _forget_read(file_path: str):
+    """Drop a path from the read cache once the agent has changed it."""
+    with _read_cache_lock:
+        _READ_CACHE.pop(os.path.normpath(file_path), None)
+
+# Static prompt templates are built once at import; only the per-call fields get interpolated
+_MODIFY_PROMPT_TMPL = """
+You are an expert code modifier. Your goal is to apply surgical changes to the provided file content.
+
+CURRENT FILE: `{file_path}`
+--- START OF FILE ---
+{original_content}
+--- END OF FILE ---
+
+USER REQUEST: "{description}"
+
+INSTRUCTIONS:
+1. Identify the exact sections of the code that need to be changed.
+2. Use one or more Search & Replace blocks to apply the changes.
+3. Each block must follow this EXACT format:
+<<<< SEARCH
+[exact code from the file to be replaced]
+====
+[the new code to replace it with]
+>>>>
+
+CRITICAL RULES:
+- The content between `<<<< SEARCH` and `====` must match the file content EXACTLY, including indentation and spacing.
+- Keep the SEARCH blocks as small as possible while remaining unique.
+- Do NOT include any explanations, markdown code blocks, or preamble. Just provide the blocks.
+- If you need to add something at the top or bottom, include a unique context in the SEARCH block.
+
+Example:
+<<<< SEARCH
+def old_func():
+    pass
+====
+def new_func():
+    print("Success")
+>>>>
+"""
+_MODIFY_RETRY_PROMPT_TMPL = "{prompt}\n\nWHAT WENT WRONG:\n{message}\n\nPlease try again with more precise SEARCH blocks."
 
 def _generate_execution_renderables(plan: str) -> tuple[Group, str]:
     """
@@ -64,31 +216,26 @@ def _generate_execution_renderables(plan: str) -> tuple[Group, str]:
     plan = plan.strip()
     # Remove code block markers
     if plan.startswith('```'):
-        lines = plan.split('\n')
-        # Remove first line if it's a code block marker
-        if lines[0].startswith('```'):
-            lines = lines[1:]
-        # Remove last line if it's a closing marker
-        if lines and lines[-1].strip() == '```':
-            lines = lines[:-1]
-        plan = '\n'.join(lines)
+        plan = _FENCE_CLOSE_RE.sub('', _FENCE_OPEN_RE.sub('', plan, count=1), count=1)
     
-    all_lines = [line.strip() for line in plan.strip().split('\n') if line.strip()]
+    all_lines = [stripped for stripped in (line.strip() for line in plan.splitlines()) if stripped]
     renderables = []
     log_results = []
     execution_header_added = False
 
     # Split lines into conversational response vs actionable plan lines
+    # Plan lines are kept pre-parsed as (line, command, params) so execution does not re-split them
     response_lines: list[str] = []
-    plan_lines: list[str] = []
+    plan_lines: list[tuple[str, str, str]] = []
     unknown_command_lines: list[str] = []
     for line in all_lines:
-        cmd_candidate, _, _ = line.partition('::')
-        if cmd_candidate.upper().strip() in VALID_COMMANDS:
-            plan_lines.append(line)
+        match = _CMD_RE.fullmatch(line)
+        if match:
+            # Interned so the dispatch chain's == checks against command literals short-circuit on identity
+            plan_lines.append((line, sys.intern(match.group(1).upper()), match.group(2) or ""))
         else:
             # If it looks like a command pattern but is not valid (e.g., RUN::...), collect it
-            if '::' in line and cmd_candidate.upper().strip() not in VALID_COMMANDS:
+            if '::' in line:
                 unknown_command_lines.append(line)
             response_lines.append(line)
 
@@ -96,15 +243,15 @@ def _generate_execution_renderables(plan: str) -> tuple[Group, str]:
     if response_lines:
         renderables.append(Text("Agent Response:", style="bold underline"))
         for line in response_lines:
-            renderables.append(Text(f"{line}", style="plan"))
+            renderables.append(Text(f"{line}", style=_STYLE_PLAN))
         log_results.append("\n".join(response_lines))
 
     # Render Agent Plan section (if any)
     if plan_lines:
         renderables.append(Text("Agent Plan:", style="bold underline"))
-        for line in plan_lines:
-            renderables.append(Text(f"{line}", style="plan"))
-        log_results.append("\n".join(plan_lines))
+        for line, _, _ in plan_lines:
+            renderables.append(Text(f"{line}", style=_STYLE_PLAN))
+        log_results.append("\n".join(line for line, _, _ in plan_lines))
 
     # Warn about unknown pseudo-commands (e.g., RUN:: ...)
     if unknown_command_lines:
@@ -116,45 +263,56 @@ def _generate_execution_renderables(plan: str) -> tuple[Group, str]:
         log_results.append("Ignored unknown commands: " + "; ".join(unknown_command_lines))
 
     # If there are many commands in a single step, cap execution to a safe maximum
-    try:
-        MAX_COMMANDS_PER_STEP = int(os.getenv("PAI_MAX_CMDS_PER_STEP", "15"))
-        if MAX_COMMANDS_PER_STEP < 1:
-            MAX_COMMANDS_PER_STEP = 1
-        if MAX_COMMANDS_PER_STEP > 50:
-            MAX_COMMANDS_PER_STEP = 50
-    except ValueError:
-        MAX_COMMANDS_PER_STEP = 15
     if len(plan_lines) > MAX_COMMANDS_PER_STEP:
         renderables.append(Text(f"\nWarning: Too many commands in a single step (>{MAX_COMMANDS_PER_STEP}). Only the first {MAX_COMMANDS_PER_STEP} will be executed.", style="warning"))
         plan_lines = plan_lines[:MAX_COMMANDS_PER_STEP]
 
-    for action in plan_lines:
+    # The leading read-only run of the plan (READ/TREE/LIST_PATH before any other command) cannot
+    # see changes made by this step, so it runs concurrently up front and the loop consumes the
+    # results keyed by (command, path). READ results also land in the read cache
+    prefetch_jobs = []
+    for _, command, params in plan_lines:
+        if command not in _READ_ONLY_COMMANDS:
+            break
+        prefetch_jobs.append((command, params if params or command == "READ" else '.'))
+    prefetch_jobs = list(dict.fromkeys(prefetch_jobs))
+    prefetched: dict[tuple[str, str], str | None] = {}
+    if len(prefetch_jobs) > 1:
+        prefetch_handlers = {"READ": _read_file_cached, "TREE": workspace.tree_directory, "LIST_PATH": workspace.list_path}
+        with ThreadPoolExecutor(max_workers=min(READ_PREFETCH_WORKERS, len(prefetch_jobs))) as pool:
+            futures = {job: pool.submit(prefetch_handlers[job[0]], job[1]) for job in prefetch_jobs}
+        # A failed prefetch (e.g. an undecodable file) is simply re-run, and reported, by the loop
+        prefetched = {job: future.result() for job, future in futures.items() if future.exception() is None}
+
+    for action, command_candidate, params in plan_lines:
         try:
-            command_candidate, _, params = action.partition('::')
-            command_candidate = command_candidate.upper().strip()
+            result = ""
+            # Add Execution Results header lazily when first execution item appears
+            if not execution_header_added:
+                renderables.append(Text("\nExecution Results:", style="bold underline"))
+                execution_header_added = True
+            action_text = Text(f"-> {action}", style=_STYLE_ACTION)
+            renderables.append(action_text)
+
+            path_handler = _PATH_COMMAND_HANDLERS.get(command_candidate)
+            if path_handler is not None:
+                result = path_handler(params)
+                _forget_read(params)
+
+            elif command_candidate == "WRITE":
+                file_path, _, _ = params.partition('::')
+                result = handle_write(file_path, params)
+                _forget_read(file_path)
             
-            if command_candidate in VALID_COMMANDS:
-                result = ""
-                # Add Execution Results header lazily when first execution item appears
-                if not execution_header_added:
-                    renderables.append(Text("\nExecution Results:", style="bold underline"))
-                    execution_header_added = True
-                action_text = Text(f"-> {action}", style="action")
-                renderables.append(action_text)
-
-                if command_candidate == "WRITE":
-                    file_path, _, _ = params.partition('::')
-                    result = handle_write(file_path, params)
-                
-                elif command_candidate == "READ":
-                    path_to_read = params
-                    content = workspace.read_file(path_to_read)
-                    if content is not None:
-                        try:
-                            lexer = get_lexer_for_filename(path_to_read)
-                            lang = lexer.aliases[0]
-                        except ClassNotFound:
-                            lang = "text"
+            elif command_candidate == "READ":
+                path_to_read = params
+                key = ("READ", path_to_read)
+                content = prefetched.pop(key) if key in prefetched else _read_file_cached(path_to_read)
+                if content is not None:
+                    if ui.IS_TTY:
+                        ext = os.path.splitext(path_to_read)[1].lower()
+                        lang = _get_lang_for_filename(ext or os.path.basename(path_to_read))
+                        from rich.syntax import Syntax
                         
                         syntax_panel = Panel(
                             Syntax(content, lang, theme="monokai", line_numbers=True, word_wrap=True),
@@ -163,183 +321,149 @@ def _generate_execution_renderables(plan: str) -> tuple[Group, str]:
                             expand=False
                         )
                         renderables.append(syntax_panel)
-                        # Log the actual content for the AI's memory
-                        log_results.append(f"Content of {path_to_read}:\n---\n{content}\n---")
-                        result = f"Success: Read and displayed {path_to_read}"
                     else:
-                        result = f"Error: Failed to read file: {path_to_read}"
+                        # Piped or quiet output: skip Pygments lexing and panel layout entirely
+                        renderables.append(Text(f"Content of {path_to_read}:\n{content}"))
+                    # Log the actual content for the AI's memory
+                    log_results.append(f"Content of {path_to_read}:\n---\n{content}\n---")
+                    result = f"Success: Read and displayed {path_to_read}"
+                else:
+                    result = f"Error: Failed to read file: {path_to_read}"
+            
+            elif command_candidate == "MODIFY":
+                file_path, _, description = params.partition('::')
                 
-                elif command_candidate == "MODIFY":
-                    file_path, _, description = params.partition('::')
-                    
-                    original_content = workspace.read_file(file_path)
-                    if original_content is None:
-                        result = f"Error: Cannot modify '{file_path}' because it does not exist or cannot be read."
-                        renderables.append(Text(f"✗ {result}", style="error"))
-                        log_results.append(result)
-                        continue
-
-                    modification_prompt = f"""
-You are an expert code modifier. Your goal is to apply surgical changes to the provided file content.
-
-CURRENT FILE: `{file_path}`
---- START OF FILE ---
-{original_content}
---- END OF FILE ---
-
-USER REQUEST: "{description}"
-
-INSTRUCTIONS:
-1. Identify the exact sections of the code that need to be changed.
-2. Use one or more Search & Replace blocks to apply the changes.
-3. Each block must follow this EXACT format:
-<<<< SEARCH
-[exact code from the file to be replaced]
-====
-[the new code to replace it with]
->>>>
-
-CRITICAL RULES:
-- The content between `<<<< SEARCH` and `====` must match the file content EXACTLY, including indentation and spacing.
-- Keep the SEARCH blocks as small as possible while remaining unique.
-- Do NOT include any explanations, markdown code blocks, or preamble. Just provide the blocks.
-- If you need to add something at the top or bottom, include a unique context in the SEARCH block.
+                original_content = _read_file_cached(file_path)
+                if original_content is None:
+                    result = f"Error: Cannot modify '{file_path}' because it does not exist or cannot be read."
+                    renderables.append(Text(f"✗ {result}", style="error"))
+                    log_results.append(result)
+                    continue
 
-Example:
-<<<< SEARCH
-def old_func():
-    pass
-====
-def new_func():
-    print("Success")
->>>>
-"""
-                    llm_response = llm.generate_text(modification_prompt)
+                modification_prompt = _MODIFY_PROMPT_TMPL.format(
+                    file_path=file_path, original_content=original_content, description=description
+                )
+                llm_response = llm.generate_text(modification_prompt)
 
-                    if llm_response:
-                        success, message = workspace.apply_surgical_edit(file_path, original_content, llm_response)
-                        
-                        # Simple retry if first attempt failed
-                        if not success:
-                            modification_prompt_retry = f"{modification_prompt}\n\nWHAT WENT WRONG:\n{message}\n\nPlease try again with more precise SEARCH blocks."
-                            llm_response_2 = llm.generate_text(modification_prompt_retry)
-                            if llm_response_2:
-                                success, message = workspace.apply_surgical_edit(file_path, original_content, llm_response_2)
-                        
-                        result = message
-                        style = "success" if success else "warning"
-                        icon = "✓ " if success else "! "
-                    else:
-                        result = f"Error: LLM failed to generate content for modification of '{file_path}'."
-                        style = "error"; icon = "✗ "
-
-                elif command_candidate == "TREE":
-                    path_to_list = params if params else '.'
-                    tree_output = workspace.tree_directory(path_to_list)
-                    if tree_output and "Error:" not in tree_output:
-                        renderables.append(Text(tree_output, style="bright_blue"))
-                        # Log the actual tree output for the AI's memory
-                        log_results.append(f"TREE result for '{path_to_list}':\n{tree_output}")
-                        result = f"Success: Displayed directory structure for '{path_to_list}'."
-                    else:
-                        result = tree_output or f"Error: Failed to display directory structure for '{path_to_list}'."
-                
-                elif command_candidate == "LIST_PATH":
-                    path_to_list = params if params else '.'
-                    list_output = workspace.list_path(path_to_list)
-                    if list_output is not None and "Error:" not in list_output:
-                        # Always display the output, even if empty (shows directory is empty)
-                        if list_output.strip():
-                            renderables.append(Text(list_output, style="bright_blue"))
-                        else:
-                            renderables.append(Text(f"Directory '{path_to_list}' is empty or contains only hidden/sensitive files.", style="dim"))
-                        # Log the actual list output for the AI's memory
-                        log_results.append(f"LIST_PATH result for '{path_to_list}':\n{list_output}")
-                        result = f"Success: Listed paths for '{path_to_list}'. Found {len(list_output.splitlines()) if list_output.strip() else 0} items."
-                    else:
-                        result = list_output or f"Error: Failed to list paths for '{path_to_list}'."
-                
-                elif command_candidate == "SEARCH":
-                    pattern, _, search_path = params.partition('::')
-                    search_path = search_path if search_path else '.'
-                    search_result = workspace.grep_search(pattern, search_path)
-                    if "Error:" not in search_result and "No matches found" not in search_result:
-                        renderables.append(Text(search_result, style="bright_blue"))
-                        log_results.append(f"SEARCH result for '{pattern}' in '{search_path}':\n{search_result}")
-                        result = f"Success: Found matches for '{pattern}' in '{search_path}'."
+                if llm_response:
+                    success, message = workspace.apply_surgical_edit(file_path, original_content, llm_response)
+                    
+                    # Simple retry if first attempt failed
+                    if not success:
+                        modification_prompt_retry = _MODIFY_RETRY_PROMPT_TMPL.format(prompt=modification_prompt, message=message)
+                        llm_response_2 = llm.generate_text(modification_prompt_retry)
+                        if llm_response_2:
+                            success, message = workspace.apply_surgical_edit(file_path, original_content, llm_response_2)
+                    
+                    _forget_read(file_path)
+                    result = message
+                else:
+                    result = f"Error: LLM failed to generate content for modification of '{file_path}'."
+
+            elif command_candidate == "TREE":
+                path_to_list = params if params else '.'
+                key = ("TREE", path_to_list)
+                tree_output = prefetched.pop(key) if key in prefetched else workspace.tree_directory(path_to_list)
+                if tree_output and "Error:" not in tree_output:
+                    renderables.append(Text(tree_output, style=_STYLE_OUTPUT))
+                    # Log the actual tree output for the AI's memory
+                    log_results.append(f"TREE result for '{path_to_list}':\n{tree_output}")
+                    result = f"Success: Displayed directory structure for '{path_to_list}'."
+                else:
+                    result = tree_output or f"Error: Failed to display directory structure for '{path_to_list}'."
+            
+            elif command_candidate == "LIST_PATH":
+                path_to_list = params if params else '.'
+                key = ("LIST_PATH", path_to_list)
+                list_output = prefetched.pop(key) if key in prefetched else workspace.list_path(path_to_list)
+                if list_output is not None and "Error:" not in list_output:
+                    # Always display the output, even if empty (shows directory is empty)
+                    if list_output.strip():
+                        renderables.append(Text(list_output, style=_STYLE_OUTPUT))
                     else:
-                        result = search_result
-                        log_results.append(result)
+                        renderables.append(Text(f"Directory '{path_to_list}' is empty or contains only hidden/sensitive files.", style="dim"))
+                    # Log the actual list output for the AI's memory
+                    log_results.append(f"LIST_PATH result for '{path_to_list}':\n{list_output}")
+                    result = f"Success: Listed paths for '{path_to_list}'. Found {len(list_output.splitlines()) if list_output.strip() else 0} items."
+                else:
+                    result = list_output or f"Error: Failed to list paths for '{path_to_list}'."
+            
+            elif command_candidate == "SEARCH":
+                pattern, _, search_path = params.partition('::')
+                search_path = search_path if search_path else '.'
+                search_result = workspace.grep_search(pattern, search_path)
+                if "Error:" not in search_result and "No matches found" not in search_result:
+                    renderables.append(Text(search_result, style=_STYLE_OUTPUT))
+                    log_results.append(f"SEARCH result for '{pattern}' in '{search_path}':\n{search_result}")
+                    result = f"Success: Found matches for '{pattern}' in '{search_path}'."
+                else:
+                    result = search_result
+                    log_results.append(result)
 
-                elif command_candidate == "MAP_ROOT":
-                    path_to_map = params if params else '.'
-                    map_output = workspace.map_workspace_pulse(path_to_map)
-                    if "Error:" not in map_output:
-                        renderables.append(Text(map_output, style="bright_blue"))
-                        log_results.append(f"MAP_ROOT result for '{path_to_map}':\n{map_output}")
-                        result = f"Success: Mapped architectural pulse for '{path_to_map}'."
-                    else:
-                        result = map_output
-                        log_results.append(result)
+            elif command_candidate == "MAP_ROOT":
+                path_to_map = params if params else '.'
+                map_output = workspace.map_workspace_pulse(path_to_map)
+                if "Error:" not in map_output:
+                    renderables.append(Text(map_output, style=_STYLE_OUTPUT))
+                    log_results.append(f"MAP_ROOT result for '{path_to_map}':\n{map_output}")
+                    result = f"Success: Mapped architectural pulse for '{path_to_map}'."
+                else:
+                    result = map_output
+                    log_results.append(result)
+
+            elif command_candidate == "RUN_COMMAND":
+                command_output = workspace.execute_command(params)
+                if "Error:" not in command_output:
+                    renderables.append(Text(command_output, style=_STYLE_OUTPUT))
+                    log_results.append(f"RUN_COMMAND result for '{params}':\n{command_output}")
+                    result = f"Success: Executed command '{params}'."
+                else:
+                    result = command_output
+                    log_results.append(result)
 
-                elif command_candidate == "RUN_COMMAND":
-                    command_output = workspace.execute_command(params)
-                    if "Error:" not in command_output:
-                        renderables.append(Text(command_output, style="bright_blue"))
-                        log_results.append(f"RUN_COMMAND result for '{params}':\n{command_output}")
-                        result = f"Success: Executed command '{params}'."
+            elif command_candidate == "DIAGNOSE":
+                diag_output = workspace.diagnose_system()
+                renderables.append(Text(diag_output, style=_STYLE_OUTPUT))
+                log_results.append(f"DIAGNOSE result:\n{diag_output}")
+                result = "Success: Performed system diagnostic."
+
+            elif command_candidate == "SNIFF_LOGS":
+                sniff_output = workspace.sniff_logs(params if params else "error")
+                renderables.append(Text(sniff_output, style=_STYLE_OUTPUT))
+                log_results.append(f"SNIFF_LOGS result for pattern '{params}':\n{sniff_output}")
+                result = f"Success: Sniffed logs for pattern '{params}'."
+
+            elif command_candidate == "PROFILE":
+                if not params:
+                    result = "Error: PROFILE requires a script path as a parameter."
+                else:
+                    profile_output = workspace.profile_python_code(params)
+                    if "Error:" not in profile_output:
+                        renderables.append(Text(profile_output, style=_STYLE_OUTPUT))
+                        log_results.append(f"PROFILE result for '{params}':\n{profile_output}")
+                        result = f"Success: Benchmarked and profiled '{params}'."
                     else:
-                        result = command_output
+                        result = profile_output
                         log_results.append(result)
 
-                elif command_candidate == "DIAGNOSE":
-                    diag_output = workspace.diagnose_system()
-                    renderables.append(Text(diag_output, style="bright_blue"))
-                    log_results.append(f"DIAGNOSE result:\n{diag_output}")
-                    result = "Success: Performed system diagnostic."
-
-                elif command_candidate == "SNIFF_LOGS":
-                    sniff_output = workspace.sniff_logs(params if params else "error")
-                    renderables.append(Text(sniff_output, style="bright_blue"))
-                    log_results.append(f"SNIFF_LOGS result for pattern '{params}':\n{sniff_output}")
-                    result = f"Success: Sniffed logs for pattern '{params}'."
-
-                elif command_candidate == "PROFILE":
-                    if not params:
-                        result = "Error: PROFILE requires a script path as a parameter."
-                    else:
-                        profile_output = workspace.profile_python_code(params)
-                        if "Error:" not in profile_output:
-                            renderables.append(Text(profile_output, style="bright_blue"))
-                            log_results.append(f"PROFILE result for '{params}':\n{profile_output}")
-                            result = f"Success: Benchmarked and profiled '{params}'."
-                        else:
-                            result = profile_output
-                            log_results.append(result)
-
-                elif command_candidate == "FINISH":
-                    result = params if params else "Task is considered complete."
+            elif command_candidate == "FINISH":
+                result = params if params else "Task is considered complete."
+                log_results.append(result)
+                renderables.append(Text(f"✓ Agent: {result}", style="success"))
+                break 
+
+            elif command_candidate == "MV":
+                source, _, dest = params.partition('::')
+                result = workspace.move_item(source, dest)
+                _forget_read(source)
+                _forget_read(dest)
+            
+            if result:
+                style, icon = _RESULT_STYLES.get(result[:8].partition(':')[0], _INFO_RESULT_STYLE)
+                renderables.append(Text(f"{icon}{result}", style=style))
+                # Log the simple success/error message for non-data commands
+                if command_candidate not in _DATA_COMMANDS:
                     log_results.append(result)
-                    renderables.append(Text(f"✓ Agent: {result}", style="success"))
-                    break 
-
-                else: # Other commands: MKDIR, TOUCH, RM, MV
-                    if command_candidate == "MKDIR": result = workspace.create_directory(params)
-                    elif command_candidate == "TOUCH": result = workspace.create_file(params)
-                    elif command_candidate == "RM": result = workspace.delete_item(params)
-                    elif command_candidate == "MV":
-                        source, _, dest = params.partition('::')
-                        result = workspace.move_item(source, dest)
-                
-                if result:
-                    if "Success" in result: style = "success"; icon = "✓ "
-                    elif "Error" in result: style = "error"; icon = "✗ "
-                    elif "Warning" in result: style = "warning"; icon = "! "
-                    else: style = "info"; icon = "i "
-                    renderables.append(Text(f"{icon}{result}", style=style))
-                    # Log the simple success/error message for non-data commands
-                    if command_candidate not in ["READ", "TREE", "LIST_PATH", "SEARCH", "MAP_ROOT", "RUN_COMMAND", "DIAGNOSE", "SNIFF_LOGS"]:
-                        log_results.append(result)
 
         except Exception as e:
             msg = f"An exception occurred while processing '{action}': {e}"
@@ -352,8 +476,7 @@ def _classify_intent(user_request: str, context: str) -> tuple[str, str, str]:
     """Classify user's intent into ('chat'|'task', 'simple'|'normal'|'complex', optional_reply_for_chat)."""
     try:
         # Quick heuristic first: if request contains a known command pattern, treat as task
-        upper_req = user_request.upper()
-        if any(cmd + "::" in upper_req for cmd in VALID_COMMANDS):
+        if _CMD_MARKER_RE.search(user_request):
             return ("task", "simple", "")
 
         prompt = (
@@ -382,64 +505,56 @@ Classify accurately based on the actual intent.
         result = llm.generate_text(classifier_input)
         mode = "task"; complexity = "normal"; reply = ""
         try:
-            data = json.loads(result)
-            if isinstance(data, dict):
-                if data.get("mode") in {"chat", "task"}:
-                    mode = data["mode"]
-                comp = data.get("complexity")
-                if isinstance(comp, str) and comp.lower() in {"simple", "normal", "complex"}:
-                    complexity = comp.lower()
-                r = data.get("reply")
-                if isinstance(r, str):
-                    reply = r.strip()
-        except Exception:
-            pass
+            data = _json_loads(result)
+        except ValueError:
+            # Malformed or empty classifier output: keep the defaults
+            data = None
+        if isinstance(data, dict):
+            if data.get("mode") in {"chat", "task"}:
+                mode = data["mode"]
+            comp = data.get("complexity")
+            if isinstance(comp, str) and comp.lower() in {"simple", "normal", "complex"}:
+                complexity = comp.lower()
+            r = data.get("reply")
+            if isinstance(r, str):
+                reply = r.strip()
         return (mode, complexity, reply)
     except Exception:
         return ("task", "normal", "")
 
+def _as_text(value) -> str:
+    """Return a stripped string, skipping the str() conversion for values that already are strings."""
+    if not isinstance(value, str):
+        value = str(value)
+    return value.strip()
+
 def _has_valid_command(plan_text: str) -> bool:
     """Check if plan text contains at least one VALID_COMMANDS line."""
-    try:
-        for line in (plan_text or "").splitlines():
-            cmd_candidate, _, _ = line.partition('::')
-            if cmd_candidate.upper().strip() in VALID_COMMANDS:
-                return True
-        return False
-    except Exception:
-        return False
-
-def handle_write(file_path: str, params: str) -> str:
-    """Invokes the LLM to create content and write it to a file."""
-    _, _, description = params.partition('::')
-    
-    if not description.strip():
-        return f"Error: No description provided for file: {file_path}"
-    
-    # Infer file type and provide context
-    file_ext = os.path.splitext(file_path)[1].lower()
-    lang_hints = {
-        '.py': 'Python',
-        '.js': 'JavaScript',
-        '.ts': 'TypeScript',
-        '.java': 'Java',
-        '.cpp': 'C++',
-        '.c': 'C',
-        '.go': 'Go',
-        '.rs': 'Rust',
-        '.rb': 'Ruby',
-        '.php': 'PHP',
-        '.html': 'HTML',
-        '.css': 'CSS',
-        '.json': 'JSON',
-        '.yaml': 'YAML',
-        '.yml': 'YAML',
-        '.md': 'Markdown',
-        '.txt': 'Plain Text'
-    }
-    language = lang_hints.get(file_ext, 'code')
-    
-    prompt = f"""You are an expert programming assistant with deep knowledge of software engineering best practices.
+    # Same line classification as the executor; stops at the first command line
+    return any(_CMD_RE.fullmatch(line.strip()) for line in (plan_text or "").splitlines())
+
+# Language names used to steer WRITE content generation, keyed by file extension
+LANG_HINTS = {
+    '.py': 'Python',
+    '.js': 'JavaScript',
+    '.ts': 'TypeScript',
+    '.java': 'Java',
+    '.cpp': 'C++',
+    '.c': 'C',
+    '.go': 'Go',
+    '.rs': 'Rust',
+    '.rb': 'Ruby',
+    '.php': 'PHP',
+    '.html': 'HTML',
+    '.css': 'CSS',
+    '.json': 'JSON',
+    '.yaml': 'YAML',
+    '.yml': 'YAML',
+    '.md': 'Markdown',
+    '.txt': 'Plain Text'
+}
+
+_WRITE_PROMPT_TMPL = """You are an expert programming assistant with deep knowledge of software engineering best practices.
 
 TARGET FILE: {file_path}
 LANGUAGE: {language}
@@ -476,44 +591,126 @@ Example of WRONG output (DO NOT DO THIS):
 
 Write high-quality code that you would be proud to ship.
 """
+
+# Opt-in (PAI_WRITE_CACHE=1): generated WRITE content is reused for an identical request against
+# the same project and the same state of the target file. Only content that was written
+# successfully is stored, and entries expire after a day
+WRITE_CACHE_TTL = 24 * 3600
+_write_cache_enabled = os.getenv("PAI_WRITE_CACHE", "0") == "1"
+_write_cache_conn: sqlite3.Connection | None = None
+# Paths already WRITE'n in this session: writing one again is a retry, so it bypasses the cache
+_written_paths: set[str] = set()
+
+def _get_write_cache() -> sqlite3.Connection | None:
+    """Open the on-disk WRITE content cache once, dropping expired entries. None if disabled or unavailable."""
+    global _write_cache_conn, _write_cache_enabled
+    if _write_cache_conn is None and _write_cache_enabled:
+        try:
+            # Same 0700 directory as the credentials: the cache holds generated source code
+            config._ensure_config_dir_exists()
+            conn = sqlite3.connect(config.get_config_dir() / "write_cache.db")
+            conn.execute("CREATE TABLE IF NOT EXISTS write_cache (key TEXT PRIMARY KEY, content TEXT NOT NULL, created REAL NOT NULL)")
+            with conn:
+                conn.execute("DELETE FROM write_cache WHERE created < ?", (time.time() - WRITE_CACHE_TTL,))
+            _write_cache_conn = conn
+        except (OSError, sqlite3.Error):
+            # Best effort: without a usable cache every WRITE simply goes to the model
+            _write_cache_enabled = False
+    return _write_cache_conn
+
+def _write_cache_key(file_path: str, description: str) -> str:
+    """Key a WRITE by its prompt inputs, the project root and the target's current (mtime_ns, size).
+
+    Whitespace in the description is normalized. A file edited since the content was generated
+    gets a different key, so a stale generation is never written over it.
+    """
+    name, temp = llm.get_runtime_model()
+    normalized = " ".join(description.split())
+    try:
+        st = os.stat(os.path.join(workspace.PROJECT_ROOT, file_path))
+        stamp = f"{st.st_mtime_ns}:{st.st_size}"
+    except OSError:
+        stamp = "absent"
+    parts = (name, str(temp), workspace.PROJECT_ROOT, file_path, stamp, normalized)
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+def _load_write_cache(key: str) -> str | None:
+    """Return cached content for a WRITE key if present and not expired."""
+    conn = _get_write_cache()
+    if conn is None:
+        return None
+    try:
+        row = conn.execute("SELECT content FROM write_cache WHERE key = ? AND created >= ?",
+                           (key, time.time() - WRITE_CACHE_TTL)).fetchone()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+def _store_write_cache(key: str, content: str):
+    """Remember generated WRITE content under its key."""
+    conn = _get_write_cache()
+    if conn is None:
+        return
+    try:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO write_cache (key, content, created) VALUES (?, ?, ?)",
+                         (key, content, time.time()))
+    except sqlite3.Error:
+        pass # Best effort cache
+
+def handle_write(file_path: str, params: str) -> str:
+    """Invokes the LLM to create content and write it to a file."""
+    _, _, description = params.partition('::')
+    
+    if not description.strip():
+        return f"Error: No description provided for file: {file_path}"
+    
+    # Infer file type and provide context
+    file_ext = os.path.splitext(file_path)[1].lower()
+    language = LANG_HINTS.get(file_ext, 'code')
+    
+    prompt = _WRITE_PROMPT_TMPL.format(file_path=file_path, language=language, description=description)
     
-    code_content = llm.generate_text(prompt)
+    cache_key = _write_cache_key(file_path, description)
+    target = os.path.normpath(file_path)
+    code_content = None if target in _written_paths else _load_write_cache(cache_key)
+    from_cache = code_content is not None
+    if code_content is None:
+        code_content = llm.generate_text(prompt)
     
     if code_content and code_content.strip():
-        return workspace.write_to_file(file_path, code_content)
+        result = workspace.write_to_file(file_path, code_content)
+        if result.startswith("Success:"):
+            _written_paths.add(target)
+            if not from_cache:
+                _store_write_cache(cache_key, code_content)
+        return result
     else:
         return f"Error: Failed to generate content from LLM for file: {file_path}"
 
+def _append_log(log_fd: int, entry: str):
+    """Appends an entry plus the separator to the session log in a single write."""
+    if hasattr(os, "writev"):
+        os.writev(log_fd, (entry.encode(), _LOG_SEPARATOR))
+    else:
+        # os.writev is POSIX-only
+        os.write(log_fd, b"".join((entry.encode(), _LOG_SEPARATOR)))
+
 def _compress_context(context: list[str], max_items: int = 10) -> str:
     """Compress context to keep only the most recent and relevant items."""
     if len(context) <= max_items:
         return "\n".join(context)
     
     # Keep first 2 items (initial context) and last max_items-2 items (recent context)
-    compressed = context[:2] + ["... [earlier context omitted for brevity] ..."] + context[-(max_items-2):]
-    return "\n".join(compressed)
+    return "\n".join((*context[:2], "... [earlier context omitted for brevity] ...", *context[-(max_items-2):]))
 
 def _clean_markdown_formatting(text: str) -> str:
     """Remove markdown formatting artifacts from text."""
     if not text:
         return text
     
-    # Remove markdown bullet points at line start
-    lines = text.split('\n')
-    cleaned_lines = []
-    for line in lines:
-        stripped = line.strip()
-        # Remove markdown list markers (*, -, +) at the start
-        if stripped.startswith('* '):
-            stripped = stripped[2:]
-        elif stripped.startswith('- '):
-            stripped = stripped[2:]
-        elif stripped.startswith('+ '):
-            stripped = stripped[2:]
-        stripped = stripped.replace('**', '')
-        cleaned_lines.append(stripped)
-    
-    return '\n'.join(cleaned_lines)
+    # Strip each line and drop a leading markdown list marker (*, -, +) in one pass, then remove bold markers
+    return _MD_LINE_RE.sub('', text).replace('**', '')
 
 def start_interactive_session():
     """Starts an interactive session with the agent."""
@@ -521,9 +718,12 @@ def start_interactive_session():
         os.makedirs(HISTORY_DIR)
     session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
     log_file_path = os.path.join(HISTORY_DIR, f"session_{session_id}.log")
+    # Keep one append-only descriptor for the whole session instead of reopening per entry
+    log_fd = os.open(log_file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
 
     session_context = []
-    pending_followup_suggestions = ""
+    _written_paths.clear()
+    _integrity_cache.clear()
     
     welcome_message = (
         "Welcome! I'm Pai, your agentic AI coding companion. Let's build something amazing together. ✨\n"
@@ -532,20 +732,12 @@ def start_interactive_session():
         "[info]Press Ctrl+C twice to exit completely.[/info]"
     )
 
-    ui.console.print(
-        Panel(
-            Text(welcome_message, justify="center"),
-            title="[bold]Interactive Auto Mode[/bold]",
-            box=ROUNDED,
-            border_style="grey50",
-            padding=(1, 2)
-        )
-    )
+    ui.print_panel(Text(welcome_message, justify="center"), "[bold]Interactive Auto Mode[/bold]")
     
     # Load brain artifact if exists
     brain_task = workspace.read_brain_artifact("task.md")
     if brain_task:
-        ui.console.print(Panel(brain_task, title="[bold]Last Known Task Progress[/bold]", border_style="bright_blue"))
+        ui.print_panel(brain_task, "[bold]Last Known Task Progress[/bold]", border_style="bright_blue", padding=(0, 1))
         session_context.append(f"[SYSTEM] Previously known task progress from .pai_brain/task.md:\n{brain_task}")
 
     # Sniff system capabilities
@@ -553,6 +745,7 @@ def start_interactive_session():
     session_context.append(f"[SYSTEM] Environmental Context:\n{sys_info}")
 
     # Setup prompt session with better input handling
+    prompt_session = None
     if PROMPT_TOOLKIT_AVAILABLE:
         prompt_session = PromptSession()
     
@@ -569,6 +762,15 @@ def start_interactive_session():
     
     signal.signal(signal.SIGINT, signal_handler)
     
+    try:
+        _run_session_loop(log_fd, session_context, prompt_session, sys_info)
+    finally:
+        os.close(log_fd)
+
+def _run_session_loop(log_fd: int, session_context: list[str], prompt_session, sys_info: str):
+    """Runs the interactive loop until the user exits, appending each interaction to the session log."""
+    pending_followup_suggestions = ""
+
     while True:
         reset_interrupt()  # Reset interrupt flag at start of each loop
         try:
@@ -631,19 +833,10 @@ You are an expert senior software engineer. {response_guidance}
 """
                 response_text = llm.generate_text(response_prompt)
             response_group, response_log = _generate_execution_renderables(response_text)
-            ui.console.print(
-                Panel(
-                    response_group,
-                    title=f"[bold]Agent Discussion[/bold]",
-                    box=ROUNDED,
-                    border_style="grey50",
-                    padding=(1, 2)
-                )
-            )
+            ui.print_panel(response_group, "[bold]Agent Discussion[/bold]")
             interaction_log = f"User: {user_input}\nMode: chat\nAI Plan:\n{response_text}\nSystem Response:\n{response_log}"
             session_context.append(interaction_log)
-            with open(log_file_path, 'a') as f:
-                f.write(interaction_log + "\n-------------------\n")
+            _append_log(log_fd, interaction_log)
             # Go to next user turn (no scheduler, no actions)
             continue
 
@@ -692,19 +885,10 @@ Analyze the request carefully. If anything is unclear, state your assumptions.
         
         response_text = llm.generate_text(response_prompt)
         response_group, response_log = _generate_execution_renderables(response_text)
-        ui.console.print(
-            Panel(
-                response_group,
-                title=f"[bold]Agent Response[/bold] (step {current_step}/{max_steps})",
-                box=ROUNDED,
-                border_style="grey50",
-                padding=(1, 2)
-            )
-        )
+        ui.print_panel(response_group, f"[bold]Agent Response[/bold] (step {current_step}/{max_steps})")
         interaction_log = f"User: {user_input}\nIteration: {current_step}\nAI Plan:\n{response_text}\nSystem Response:\n{response_log}"
         session_context.append(interaction_log)
-        with open(log_file_path, 'a') as f:
-            f.write(interaction_log + "\n-------------------\n")
+        _append_log(log_fd, interaction_log)
         last_system_response = response_log
 
         # Always use the Task Scheduler for 'task' mode to outline steps first
@@ -789,7 +973,7 @@ Example of BAD planning (too monolithic):
         # Try to render scheduler JSON as a nice table
         parsed_scheduler = None
         try:
-            parsed_scheduler = json.loads(scheduler_plan)
+            parsed_scheduler = _json_loads(scheduler_plan)
         except Exception:
             parsed_scheduler = None
 
@@ -800,51 +984,40 @@ Example of BAD planning (too monolithic):
             table.add_column("Title", overflow="fold")
             table.add_column("Hint", overflow="fold")
             for idx, step in enumerate(steps, start=1):
-                title = str(step.get("title", "")).strip()
-                hint = str(step.get("hint", "")).strip()
-                table.add_row(str(idx), title, hint)
+                table.add_row(str(idx), _as_text(step.get("title", "")), _as_text(step.get("hint", "")))
             scheduler_group = Group(Text("Task Plan", style="bold underline"), table)
             scheduler_log = json.dumps(parsed_scheduler, indent=2)
         else:
             scheduler_group, scheduler_log = _generate_execution_renderables(scheduler_plan)
 
-        ui.console.print(
-            Panel(
-                scheduler_group,
-                title=f"[bold]Task Scheduler[/bold] (step {current_step}/{max_steps})",
-                box=ROUNDED,
-                border_style="grey50",
-                padding=(1, 2)
-            )
-        )
+        ui.print_panel(scheduler_group, f"[bold]Task Scheduler[/bold] (step {current_step}/{max_steps})")
         interaction_log = f"User: {user_input}\nIteration: {current_step}\nAI Plan:\n{scheduler_plan}\nSystem Response:\n{scheduler_log}"
         session_context.append(interaction_log)
-        with open(log_file_path, 'a') as f:
-            f.write(interaction_log + "\n-------------------\n")
+        _append_log(log_fd, interaction_log)
         last_system_response = scheduler_log
         pending_followup_suggestions = scheduler_plan
 
         # Parse scheduler hints from JSON; fallback to heuristic if JSON parsing fails
         scheduler_hints: list[str] = []
+        append = scheduler_hints.append
         parsed = parsed_scheduler
         if isinstance(parsed, dict) and isinstance(parsed.get("steps"), list):
             for step in parsed["steps"]:
-                title = str(step.get("title", "")).strip()
-                hint = str(step.get("hint", "")).strip()
-                combined = hint or title
+                # Only fall back to the title when the hint is empty
+                combined = _as_text(step.get("hint", "")) or _as_text(step.get("title", ""))
                 if combined:
-                    scheduler_hints.append(combined)
+                    append(combined)
         else:
             for raw_line in scheduler_plan.splitlines():
                 stripped = raw_line.strip()
                 if stripped[:2].isdigit() and (stripped[1:2] in {'.', ')'}):
                     hint = stripped[2:].strip(" -:\t")
                     if hint:
-                        scheduler_hints.append(hint)
-                elif stripped and (stripped[0].isdigit() and (stripped.split(' ', 1)[0].rstrip('.)').isdigit())):
-                    parts = stripped.split(' ', 1)
-                    if len(parts) == 2:
-                        scheduler_hints.append(parts[1].strip())
+                        append(hint)
+                elif stripped and stripped[0].isdigit():
+                    number, sep, rest = stripped.partition(' ')
+                    if sep and number.rstrip('.)').isdigit():
+                        append(rest.strip())
 
         # Collaborative Planning: Ask for approval before proceeding
         while True:
@@ -877,8 +1050,10 @@ Example of BAD planning (too monolithic):
         _update_brain_task(scheduler_hints, 0)
 
         # Steps 3+: Action iterations (one or more actionable commands per step when appropriate)
-        # Cap the number of action steps to at most 5 and also to the number of hints
-        action_steps_count = min(5, max(1, len(scheduler_hints) if scheduler_hints else 3))
+        # Cap the number of action steps to at most 5 and also to the number of hints;
+        # an empty or single-step plan only pays for one action round-trip
+        action_steps_count = min(5, max(1, len(scheduler_hints)))
+        previous_plan = None
         
         for action_iteration in range(action_steps_count):
             current_step += 1
@@ -903,7 +1078,8 @@ Example of BAD planning (too monolithic):
             # Supply a scheduler hint (if available) to make the step focused
             step_hint = scheduler_hints[action_iteration] if action_iteration < len(scheduler_hints) else ""
             
-            # Thinking phase (pre-execution): produce a concise internal reasoning summary (no commands)
+            # Thinking phase (pre-execution): produce a concise internal reasoning summary (no commands).
+            # The step hint follows the history so every step of a turn shares the same prompt prefix
             thinking_prompt = f"""
 You are Pai, an expert, proactive, and autonomous software developer AI.
 You are a creative problem-solver with deep technical expertise, not just a command executor.
@@ -930,8 +1106,6 @@ CRITICAL OUTPUT FORMAT:
 - Think like Cascade: surgical, focused, one area at a time
 - Explicitly state estimated modification size and approach
 
-Target step hint: {step_hint}
-
 --- CONVERSATION HISTORY (all previous turns) ---
 {context_str}
 --- END HISTORY ---
@@ -940,6 +1114,8 @@ Target step hint: {step_hint}
 {last_system_response}
 --- END LAST SYSTEM RESPONSE ---
 
+Target step hint: {step_hint}
+
 --- LATEST USER REQUEST ---
 "{user_effective_request}"
 --- END USER REQUEST ---
@@ -951,17 +1127,11 @@ Think carefully and methodically.
             thinking_text = _clean_markdown_formatting(thinking_text)
             # Render concise thinking summary (no commands expected)
             thinking_group, thinking_log = _generate_execution_renderables(thinking_text)
-            ui.console.print(
-                Panel(
-                    thinking_group,
-                    title=f"[bold]Thinking[/bold] (pre-execution for step {current_step}/{max_steps})",
-                    box=ROUNDED,
-                    border_style="grey50",
-                    padding=(1, 2)
-                )
-            )
+            ui.print_panel(thinking_group, f"[bold]Thinking[/bold] (pre-execution for step {current_step}/{max_steps})")
             session_context.append(f"Pre-Execution Thinking (step {current_step}):\n{thinking_text}")
 
+            # Static rules and command reference come first and per-step content last, so consecutive
+            # calls share a byte-identical prompt prefix the provider can cache
             action_prompt = f"""
 You are Pai, an expert, proactive, and autonomous software developer AI.
 You are a creative problem-solver with deep technical expertise, not just a command executor.
@@ -985,11 +1155,6 @@ CRITICAL OUTPUT FORMAT RULES:
 
 {guidance}
 
-Target step hint: {step_hint}
-
---- YOUR THINKING SUMMARY (use as guidance; do not echo back) ---
-{thinking_text}
---- END THINKING SUMMARY ---
 --- VALID COMMANDS ---
 1. MKDIR::path - Create directory
 2. TOUCH::path - Create empty file
@@ -1024,6 +1189,12 @@ PRINCIPLES OF INTELLIGENCE:
 {last_system_response}
 --- END LAST SYSTEM RESPONSE ---
 
+Target step hint: {step_hint}
+
+--- YOUR THINKING SUMMARY (use as guidance; do not echo back) ---
+{thinking_text}
+--- END THINKING SUMMARY ---
+
 --- LATEST USER REQUEST ---
 "{user_effective_request}"
 --- END USER REQUEST ---
@@ -1058,21 +1229,20 @@ Target step hint: {step_hint}
 15. FINISH::message
 """
                 plan = llm.generate_text(reprompt)
+
+            # An identical plan to the previous step means the agent is stuck; stop instead of re-running it
+            if plan and plan == previous_plan:
+                ui.print_warning("Agent repeated its previous action plan. Stopping execution to avoid a loop.")
+                session_context.append(f"[SYSTEM] Repeated action plan detected at step {current_step}; execution stopped.")
+                break
+            previous_plan = plan
+
             renderable_group, log_string = _generate_execution_renderables(plan)
-            ui.console.print(
-                Panel(
-                    renderable_group,
-                    title=f"[bold]Agent Action[/bold] (step {current_step}/{max_steps})",
-                    box=ROUNDED,
-                    border_style="grey50",
-                    padding=(1, 2)
-                )
-            )
+            ui.print_panel(renderable_group, f"[bold]Agent Action[/bold] (step {current_step}/{max_steps})")
 
             interaction_log = f"User: {user_input}\nIteration: {current_step}\nAI Plan:\n{plan}\nSystem Response:\n{log_string}"
             session_context.append(interaction_log)
-            with open(log_file_path, 'a') as f:
-                f.write(interaction_log + "\n-------------------\n")
+            _append_log(log_fd, interaction_log)
 
             last_system_response = log_string
 
@@ -1117,12 +1287,11 @@ Context:
 Be thorough but fair. Successful command execution should be recognized as success.
 Output ONLY the JSON object.
 """
-            integrity_json = llm.generate_text(integrity_prompt)
+            parsed = _run_integrity_check(integrity_prompt)
             # Best-effort parse
             verdict = {"passed": False, "reasons": [], "next_fix": [], "quality_score": 0}
             try:
-                parsed = json.loads(integrity_json)
-                if isinstance(parsed, dict):
+                if parsed is not None:
                     verdict["passed"] = bool(parsed.get("passed", False))
                     r = parsed.get("reasons")
                     if isinstance(r, list): verdict["reasons"] = [str(x) for x in r]
@@ -1155,15 +1324,7 @@ Output ONLY the JSON object.
                 fixes_text = "\n".join(verdict["next_fix"])
                 table.add_row(fix_label, fixes_text)
             integrity_group = Group(Text("Integrity Check", style="bold underline"), table)
-            ui.console.print(
-                Panel(
-                    integrity_group,
-                    title=f"[bold]Integrity[/bold] (post-execution step {current_step}/{max_steps})",
-                    box=ROUNDED,
-                    border_style="grey50",
-                    padding=(1, 2)
-                )
-            )
+            ui.print_panel(integrity_group, f"[bold]Integrity[/bold] (post-execution step {current_step}/{max_steps})")
             session_context.append(f"Integrity Check (step {current_step}): {json.dumps(verdict)}")
 
             # --- Phase 8: Architectural Guardrails & Security Audit ---
@@ -1213,7 +1374,7 @@ Output ONLY the JSON object.
                 
                 healing_response = llm.generate_text(healing_prompt)
                 h_group, h_log = _generate_execution_renderables(healing_response)
-                ui.console.print(Panel(h_group, title="[bold red]Self-Healing Action[/bold]", border_style="red"))
+                ui.print_panel(h_group, "[bold red]Self-Healing Action[/bold]", border_style="red", padding=(0, 1))
                 
                 interaction_log = f"Self-Healing Attempt:\nAI Action:\n{healing_response}\nSystem Response:\n{h_log}"
                 session_context.append(interaction_log)
@@ -1228,18 +1389,42 @@ Output ONLY the JSON object.
         # Final Summary step
         current_step += 1
 
+
+def _run_integrity_check(integrity_prompt: str) -> dict | None:
+    """Runs the integrity LLM check and returns the parsed verdict, or None if the reply was not a JSON object.
+
+    Parsed verdicts are reused for an identical step hint, result and request within the session.
+    """
+    key = hashlib.blake2b(integrity_prompt.encode(), digest_size=16).hexdigest()
+    cached = _integrity_cache.get(key)
+    if cached is not None:
+        return cached
+
+    integrity_json = llm.generate_text(integrity_prompt)
+    try:
+        parsed = _json_loads(integrity_json)
+    except ValueError:
+        return None
+    if not isinstance(parsed, dict):
+        return None
+    # Only verdicts that parsed are remembered; a failed or garbled reply is asked again next time
+    if len(_integrity_cache) >= INTEGRITY_CACHE_SIZE:
+        _integrity_cache.pop(next(iter(_integrity_cache)))
+    _integrity_cache[key] = parsed
+    return parsed
+
 def _update_brain_task(hints: list[str], current_idx: int):
     """Syncs the current task progress to .pai_brain/task.md."""
     try:
         if not hints:
             return
             
-        content = "# Active Task Progress\n\n"
+        parts = ["# Active Task Progress\n\n"]
         for i, hint in enumerate(hints):
             status = "[x]" if i < current_idx else "[/]" if i == current_idx else "[ ]"
-            content += f"- {status} {hint}\n"
+            parts.append(f"- {status} {hint}\n")
             
-        workspace.write_brain_artifact("task.md", content)
+        workspace.write_brain_artifact("task.md", "".join(parts))
     except Exception:
         pass # Best effort sync
 
@@ -1267,7 +1452,7 @@ def _architectural_audit(modification_description: str, session_context_str: str
         response = llm.generate_text(audit_prompt)
         # Clean potential markdown from response
         clean_res = response.strip().strip('`').replace('json\n', '', 1)
-        audit_res = json.loads(clean_res)
+        audit_res = _json_loads(clean_res)
         return audit_res
     except Exception:
         return {"passed": True, "score": 8, "issues": ["Audit system timeout - proceeding with caution"], "suggestions": []}
@@ -1304,15 +1489,7 @@ Provide a summary that demonstrates deep understanding of what was accomplished
 """
         summary_plan = llm.generate_text(summary_prompt)
         summary_group, summary_log = _generate_execution_renderables(summary_plan)
-        ui.console.print(
-            Panel(
-                summary_group,
-                title=f"[bold]Agent Response[/bold] (step {current_step}/{max_steps} - final summary)",
-                box=ROUNDED,
-                border_style="grey50",
-                padding=(1, 2)
-            )
-        )
+        ui.print_panel(summary_group, f"[bold]Agent Response[/bold] (step {current_step}/{max_steps} - final summary)")
         session_context.append(f"Final Summary:\n{summary_plan}\nSystem Response:\n{summary_log}")
         with open(log_file_path, 'a') as f:
             f.write(f"Final Summary:\n{summary_plan}\nSystem Response:\n{summary_log}\n-------------------\n")
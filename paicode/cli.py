@@ -1,20 +1,17 @@
 #!/usr/bin/env python
 
 import argparse
-from . import agent, config, llm, ui, __version__
-
-def main():
-    parser = argparse.ArgumentParser(
-        description="Pai Code: Your Agentic AI Coding Companion.",
-        epilog="Run 'pai config --help' for API key management. Use 'pai config reset blacklist' to unblock rate-limited keys. Run 'pai' or 'pai auto' to start the agent."
-    )
-    parser.add_argument('-v', '--version', action='version', version=f'Pai Code v{__version__}')
-    subparsers = parser.add_subparsers(dest='command', help='Available commands')
+import sys
+from . import ui, __version__
 
+def _add_auto_parser(subparsers):
+    """Registers the `auto` subcommand (interactive agent session)."""
     parser_auto = subparsers.add_parser('auto', help='Start the interactive AI agent session.')
     parser_auto.add_argument('--model', type=str, help='LLM model name (e.g., gemini-2.5-flash-lite)')
     parser_auto.add_argument('--temperature', type=float, help='LLM sampling temperature (e.g., 0.2)')
 
+def _add_config_parser(subparsers):
+    """Registers the `config` subcommand and its API key management subcommands."""
     parser_config = subparsers.add_parser('config', help='Manage the API key configuration')
     config_subparsers = parser_config.add_subparsers(dest='config_cmd', help='Available config subcommands')
 
@@ -41,24 +38,75 @@ def main():
     config_group.add_argument('--show', action='store_true', help='Show the currently configured API key (DEPRECATED)')
     config_group.add_argument('--remove', action='store_true', help='Remove the stored API key (DEPRECATED)')
 
+def _list_keys():
+    """Prints the configured API keys (masked) as a table."""
+    from . import config
+    from rich.table import Table
+    rows = config.list_api_keys()
+    # Pretty table
+    table = Table(show_header=True, header_style="bold")
+    table.add_column("ID", style="bold")
+    table.add_column("Masked Key")
+    table.add_column("Default", justify="center")
+    for r in rows:
+        table.add_row(r.get('id',''), r.get('masked',''), r.get('is_default',''))
+    ui.console.print(table)
+
+def _run_session(model=None, temperature=None):
+    """Starts the interactive agent session, applying any model/temperature overrides."""
+    # Imported here so `pai config ...` never loads the LLM stack (google-generativeai, agent)
+    from . import agent, llm
+
+    # Configure LLM runtime if flags provided
+    if model is not None or temperature is not None:
+        llm.set_runtime_model(model, temperature)
+    try:
+        agent.start_interactive_session()
+    except KeyboardInterrupt:
+        ui.print_info("\nSession terminated by user.")
+    except Exception as e:
+        ui.print_error(f"An error occurred during the session: {e}")
+        return 1
+
+def main():
+    # The two most common invocations take no options, so they skip building the parser
+    argv = sys.argv[1:]
+    if not argv:
+        return _run_session()
+    if argv == ['config', 'list']:
+        _list_keys()
+        return
+
+    parser = argparse.ArgumentParser(
+        description="Pai Code: Your Agentic AI Coding Companion.",
+        epilog="Run 'pai config --help' for API key management. Use 'pai config reset blacklist' to unblock rate-limited keys. Run 'pai' or 'pai auto' to start the agent."
+    )
+    parser.add_argument('-v', '--version', action='version', version=f'Pai Code v{__version__}')
+    subparsers = parser.add_subparsers(dest='command', help='Available commands')
+
+    # Only build the subparser that will be used; top-level help, --version and
+    # unknown commands still get the full command list
+    cmd = argv[0]
+    if cmd == 'auto':
+        _add_auto_parser(subparsers)
+    elif cmd == 'config':
+        _add_config_parser(subparsers)
+    else:
+        _add_auto_parser(subparsers)
+        _add_config_parser(subparsers)
+
     args = parser.parse_args()
 
     if args.command == 'config':
+        # Imported per branch so `pai config ...` never loads the LLM stack (google-generativeai, agent)
+        from . import config
+
         # Handle new subcommands first
         if args.config_cmd == 'add':
             config.add_api_key(args.id, args.key)
             return
         elif args.config_cmd == 'list':
-            rows = config.list_api_keys()
-            # Pretty table
-            from rich.table import Table
-            table = Table(show_header=True, header_style="bold")
-            table.add_column("ID", style="bold")
-            table.add_column("Masked Key")
-            table.add_column("Default", justify="center")
-            for r in rows:
-                table.add_row(r.get('id',''), r.get('masked',''), r.get('is_default',''))
-            ui.console.print(table)
+            _list_keys()
             return
         elif args.config_cmd == 'show':
             config.show_api_key(args.id)
@@ -86,18 +134,7 @@ def main():
             ui.print_warning("Legacy --remove is deprecated. Use: pai config remove <ID>")
             return
     else:
-        # Configure LLM runtime if flags provided
-        model = getattr(args, 'model', None)
-        temperature = getattr(args, 'temperature', None)
-        if model is not None or temperature is not None:
-            llm.set_runtime_model(model, temperature)
-        try:
-            agent.start_interactive_session()
-        except KeyboardInterrupt:
-            ui.print_info("\nSession terminated by user.")
-        except Exception as e:
-            ui.print_error(f"An error occurred during the session: {e}")
-            return 1
+        return _run_session(args.model, args.temperature)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,18 +1,73 @@
+import atexit
 import os
+import re
 import time
 from pathlib import Path
 import json
 from typing import Optional, Tuple, Dict, Any, List
 from . import ui
 
-# Define the standard configuration path in the user's home directory
-CONFIG_DIR = Path.home() / ".config" / "pai-code"
-KEY_FILE = CONFIG_DIR / "credentials"
+# Prefer orjson (optional) for the credentials store (read on every CLI call); fall back to the stdlib
+try:
+    import orjson
+
+    def _json_loads(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson rejects NaN/Infinity and integers wider than 64 bits, which json accepts
+            return json.loads(data)
+
+    def _json_dumps(data: Dict[str, Any]) -> bytes:
+        try:
+            return orjson.dumps(data)
+        except orjson.JSONEncodeError:
+            return json.dumps(data, separators=(",", ":")).encode()
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(data: Dict[str, Any]) -> bytes:
+        return json.dumps(data, separators=(",", ":")).encode()
+
+# Configuration lives in the user's home directory (or $PAI_CONFIG_DIR). Resolved on first use,
+# since looking up the home directory is wasted work for commands that never touch config
+_config_dir: Optional[Path] = None
+_key_file: Optional[Path] = None
+
+def get_config_dir() -> Path:
+    """Return the configuration directory, resolving it on first call."""
+    global _config_dir
+    if _config_dir is None:
+        override = os.environ.get("PAI_CONFIG_DIR")
+        _config_dir = Path(override) if override else Path.home() / ".config" / "pai-code"
+    return _config_dir
+
+def _get_key_file() -> Path:
+    global _key_file
+    if _key_file is None:
+        _key_file = get_config_dir() / "credentials"
+    return _key_file
+
+def __getattr__(name: str) -> Path:
+    # Keep the former module constants available as config.CONFIG_DIR / config.KEY_FILE
+    if name == "CONFIG_DIR":
+        return get_config_dir()
+    if name == "KEY_FILE":
+        return _get_key_file()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Set once the directory has been created/secured, so later loads and saves skip the syscalls
+_dir_ready = False
 
 def _ensure_config_dir_exists():
     """Ensures the configuration directory exists with correct permissions."""
-    os.makedirs(CONFIG_DIR, exist_ok=True)
-    os.chmod(CONFIG_DIR, 0o700)
+    global _dir_ready
+    if _dir_ready:
+        return
+    config_dir = get_config_dir()
+    os.makedirs(config_dir, exist_ok=True)
+    os.chmod(config_dir, 0o700)
+    _dir_ready = True
 
 def _default_store() -> Dict[str, Any]:
     return {
@@ -24,15 +79,53 @@ def _default_store() -> Dict[str, Any]:
         "blacklist": {}   # {key_id: timestamp_when_to_unblock}
     }
 
+# Key ids are single command-line words: any whitespace (including \r, \v, \f) is rejected
+_BAD_KEY_ID_RE = re.compile(r'\s')
+
+# Upper bound on the credentials file size accepted by _load_store()
+MAX_STORE_BYTES = 1024 * 1024
+
+# Parsed store from the last load/save, reused while the file's (mtime_ns, size) stamp is unchanged
+_store_cache: Optional[Tuple[Tuple[int, int], Dict[str, Any]]] = None
+
+def _store_stamp() -> Tuple[int, int]:
+    st = os.stat(_get_key_file())
+    return (st.st_mtime_ns, st.st_size)
+
+# Set when the round-robin cursor has advanced in memory but not yet been written
+_rotation_dirty = False
+
+def _flush_rotation() -> None:
+    """Write a cursor advanced in memory, unless another process changed the file meanwhile."""
+    if not _rotation_dirty or _store_cache is None:
+        return
+    try:
+        unchanged = _store_stamp() == _store_cache[0]
+    except OSError:
+        return
+    if unchanged:
+        _save_store(_store_cache[1])
+
+atexit.register(_flush_rotation)
+
 def _load_store() -> Dict[str, Any]:
     """Load the multi-key JSON store. If legacy plaintext is found, migrate it."""
+    global _store_cache
     _ensure_config_dir_exists()
-    if not KEY_FILE.exists():
+    key_file = _get_key_file()
+    if not key_file.exists():
         return _default_store()
     try:
-        raw = KEY_FILE.read_text().strip()
+        stamp = _store_stamp()
+        if _store_cache is not None and _store_cache[0] == stamp:
+            return _store_cache[1]
+        # The store holds a few short keys; refuse anything wildly larger instead of reading it in
+        if stamp[1] > MAX_STORE_BYTES:
+            raise ValueError(f"{key_file} is {stamp[1]} bytes, larger than the {MAX_STORE_BYTES} byte limit")
+        # Parsed straight from bytes (both orjson and json accept them), skipping a decode
+        raw = key_file.read_bytes().strip()
         try:
-            data = json.loads(raw)
+            data = _json_loads(raw)
             # basic shape validation
             if not isinstance(data, dict) or "keys" not in data:
                 raise ValueError("Invalid credentials store format")
@@ -46,10 +139,11 @@ def _load_store() -> Dict[str, Any]:
             # Ensure blacklist exists
             if "blacklist" not in data or not isinstance(data.get("blacklist"), dict):
                 data["blacklist"] = {}
+            _store_cache = (stamp, data)
             return data
-        except json.JSONDecodeError:
+        except json.JSONDecodeError:  # orjson.JSONDecodeError subclasses it
             # Legacy plaintext: single key. Migrate.
-            key = raw
+            key = raw.decode()
             store = _default_store()
             store["keys"]["primary"] = key
             store["default"] = "primary"
@@ -62,12 +156,27 @@ def _load_store() -> Dict[str, Any]:
         return _default_store()
 
 def _save_store(data: Dict[str, Any]) -> None:
+    global _store_cache, _rotation_dirty
     try:
         _ensure_config_dir_exists()
-        with open(KEY_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
-        os.chmod(KEY_FILE, 0o600)
+        # Write a private temp file and rename it over the store, so readers never see a partial file.
+        # The file is created with mode 0o600 (the umask can only narrow it), so no chmod is needed.
+        # A temp file left behind by an interrupted save is removed first: O_CREAT only applies the
+        # mode to a new file, and O_EXCL guarantees this one is new
+        key_file = _get_key_file()
+        tmp_file = key_file.with_name(key_file.name + ".tmp")
+        try:
+            os.unlink(tmp_file)
+        except FileNotFoundError:
+            pass
+        with open(os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb') as f:
+            f.write(_json_dumps(data))
+        os.replace(tmp_file, key_file)
+        _store_cache = (_store_stamp(), data)
+        _rotation_dirty = False
     except Exception as e:
+        # The cached copy may hold changes that never reached disk
+        _store_cache = None
         ui.print_error(f"Failed to save credentials: {e}")
 
 def save_api_key(api_key: str):
@@ -88,7 +197,7 @@ def get_default_key_id() -> Optional[str]:
     return store.get("default")
 
 def add_api_key(key_id: str, api_key: str) -> None:
-    if not key_id or any(ch in key_id for ch in (' ', '\t', '\n')):
+    if not key_id or _BAD_KEY_ID_RE.search(key_id):
         ui.print_error("Error: key id must be a simple identifier without spaces.")
         return
     store = _load_store()
@@ -101,6 +210,13 @@ def add_api_key(key_id: str, api_key: str) -> None:
     _save_store(store)
     ui.print_success(f"API key '{key_id}' has been {'added' if created else 'updated'}.")
 
+def _mask(api_key: str) -> str:
+    """Return the display form of an API key: its first and last few characters."""
+    # Handle short keys gracefully
+    if len(api_key) < 10:
+        return f"{api_key[:2]}...{api_key[-2:]}"
+    return f"{api_key[:5]}...{api_key[-4:]}"
+
 def list_api_keys() -> List[Dict[str, str]]:
     """Return a list of keys with id and masked value for display."""
     store = _load_store()
@@ -108,17 +224,9 @@ def list_api_keys() -> List[Dict[str, str]]:
     default_id = store.get("default")
     for kid in store.get("order", []):
         val = store["keys"].get(kid, "")
-        if val:
-            # Handle short keys gracefully
-            if len(val) < 10:
-                masked = f"{val[:2]}...{val[-2:]}"
-            else:
-                masked = f"{val[:5]}...{val[-4:]}"
-        else:
-            masked = ""
         rows.append({
             "id": kid,
-            "masked": masked,
+            "masked": _mask(val) if val else "",
             "is_default": "yes" if kid == default_id else ""
         })
     return rows
@@ -135,11 +243,7 @@ def show_api_key(key_id: Optional[str] = None):
     if not val:
         ui.print_error(f"API key id '{key_id}' not found.")
         return
-    # Handle short keys gracefully
-    if len(val) < 10:
-        masked_key = f"{val[:2]}...{val[-2:]}"
-    else:
-        masked_key = f"{val[:5]}...{val[-4:]}"
+    masked_key = _mask(val)
     suffix = " (default)" if key_id == store.get("default") else ""
     ui.print_info(f"Key [{key_id}]{suffix}: {masked_key}")
 
@@ -188,6 +292,40 @@ def next_api_key() -> Optional[Tuple[str, str]]:
     _save_store(store)
     return (key_id, key_val)
 
+def _prune_blacklist(store: Dict[str, Any], now: float) -> bool:
+    """Drop expired blacklist entries from the store in place. Returns True if any were removed."""
+    blacklist = store.setdefault("blacklist", {})
+    expired_keys = [k for k, v in blacklist.items() if v <= now]
+    for k in expired_keys:
+        del blacklist[k]
+    return bool(expired_keys)
+
+def _read_rpm_limit() -> float:
+    try:
+        return max(0.0, float(os.environ.get("PAI_RPM_PER_KEY", "0")))
+    except ValueError:
+        return 0.0
+
+# Optional client-side pacing: at most PAI_RPM_PER_KEY requests per minute per key, so keys are
+# rested before the provider answers 429. Unset or 0 disables it. Budgets are per process
+RPM_PER_KEY = _read_rpm_limit()
+
+# Token bucket per key id: [tokens, monotonic time of last refill]. Holds up to a minute's budget
+_buckets: Dict[str, List[float]] = {}
+
+def _bucket_wait(key_id: str, now: float) -> float:
+    """Refill a key's bucket; return seconds until it holds a whole token (0.0 when it does)."""
+    capacity = max(RPM_PER_KEY, 1.0)
+    bucket = _buckets.get(key_id)
+    if bucket is None:
+        bucket = _buckets[key_id] = [capacity, now]
+    else:
+        bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * RPM_PER_KEY / 60)
+        bucket[1] = now
+    if bucket[0] >= 1:
+        return 0.0
+    return (1 - bucket[0]) * 60 / RPM_PER_KEY
+
 def get_next_available_key() -> Optional[Tuple[str, str]]:
     """Get next available key that's not blacklisted (smart rotation).
     
@@ -197,44 +335,69 @@ def get_next_available_key() -> Optional[Tuple[str, str]]:
     Returns:
         Tuple of (key_id, key_value) if available, None if all keys are blacklisted.
     """
+    global _rotation_dirty
     store = _load_store()
     order = store.get("order", [])
     if not order:
         return None
     
-    blacklist = store.get("blacklist", {})
-    current_time = time.time()
+    expired = _prune_blacklist(store, time.time())
+    blacklist = store["blacklist"]
     
-    # Clean expired blacklist entries (older than 10 minutes = 600 seconds)
-    expired_keys = [k for k, v in blacklist.items() if v <= current_time]
-    for k in expired_keys:
-        del blacklist[k]
-    
-    store["blacklist"] = blacklist
-    
-    # Try to find non-blacklisted key (max attempts = number of keys)
-    attempts = 0
-    max_attempts = len(order)
-    
-    while attempts < max_attempts:
-        idx = store.get("rr_index", 0) % len(order)
+    # Try each key at most once, starting at the cursor. With pacing enabled, a key whose
+    # request budget is spent is passed over; the one that refills soonest is kept as fallback
+    # (the caller then waits for it via reserve_request())
+    count = len(order)
+    idx = store.get("rr_index", 0) % count
+    keys = store.get("keys", {})
+    now = time.monotonic()
+    chosen = None
+    soonest = None  # (wait_seconds, key_id, cursor after it)
+    for _ in range(count):
         key_id = order[idx]
-        
         # Advance cursor for next call
-        store["rr_index"] = (idx + 1) % len(order)
+        idx = (idx + 1) % count
         
         # Check if this key is blacklisted
-        if key_id not in blacklist:
-            # Found available key, save state and return
-            _save_store(store)
-            key_val = store.get("keys", {}).get(key_id)
-            return (key_id, key_val)
-        
-        attempts += 1
+        if key_id in blacklist:
+            continue
+        wait = _bucket_wait(key_id, now) if RPM_PER_KEY else 0.0
+        if not wait:
+            chosen = key_id
+            break
+        if soonest is None or wait < soonest[0]:
+            soonest = (wait, key_id, idx)
     
-    # All keys are blacklisted
-    _save_store(store)
-    return None
+    if chosen is None and soonest is not None:
+        _, chosen, idx = soonest
+    
+    store["rr_index"] = idx
+    if chosen is None:
+        # All keys are blacklisted (the cursor has come full circle)
+        _save_store(store)
+        return None
+    
+    # Found available key. A plain cursor advance stays in memory and is written
+    # at exit (or with the next save); pruned blacklist entries are saved right away
+    if expired:
+        _save_store(store)
+    else:
+        _rotation_dirty = True
+    return (chosen, keys.get(chosen))
+
+def reserve_request(key_id: str) -> float:
+    """Take one request from a key's pacing budget.
+    
+    Returns:
+        Seconds the caller should wait before sending the request (0.0 when the
+        budget has room or pacing is disabled).
+    """
+    if not RPM_PER_KEY:
+        return 0.0
+    wait = _bucket_wait(key_id, time.monotonic())
+    # May go negative: the debt is repaid by the refill during the caller's wait
+    _buckets[key_id][0] -= 1
+    return wait
 
 def blacklist_key(key_id: str, duration_seconds: int = 600) -> None:
     """Temporarily blacklist a key due to rate limiting.
@@ -250,6 +413,9 @@ def blacklist_key(key_id: str, duration_seconds: int = 600) -> None:
     unblock_time = time.time() + duration_seconds
     store["blacklist"][key_id] = unblock_time
     _save_store(store)
+    # The provider says the key is spent, so its pacing budget is too
+    if RPM_PER_KEY:
+        _buckets[key_id] = [0.0, time.monotonic()]
     
     # Convert seconds to minutes for user-friendly message
     minutes = duration_seconds / 60
@@ -261,17 +427,13 @@ def get_blacklist_status() -> Dict[str, float]:
     Returns:
         Dict mapping key_id to remaining seconds until unblock.
     """
-    store = _load_store()
-    blacklist = store.get("blacklist", {})
+    # Served from the cached store; only a stat() touches the disk
     current_time = time.time()
-    
-    status = {}
-    for key_id, unblock_time in blacklist.items():
-        remaining = unblock_time - current_time
-        if remaining > 0:
-            status[key_id] = remaining
-    
-    return status
+    return {
+        key_id: unblock_time - current_time
+        for key_id, unblock_time in _load_store().get("blacklist", {}).items()
+        if unblock_time > current_time
+    }
 
 def reset_blacklist() -> None:
     """Reset the API key blacklist, unblocking all keys.
@@ -1,41 +1,55 @@
+import hashlib
 import os
+import random
+import re
 import warnings
 import time
-
-# Reduce noisy STDERR logs from gRPC/absl before importing Google SDKs.
-# These settings aim to suppress INFO/WARNING/ERROR logs emitted by native libs
-# that happen prior to Python log initialization.
-os.environ.setdefault("GRPC_VERBOSITY", "NONE")
-os.environ.setdefault("GRPC_LOG_SEVERITY", "ERROR")
-# Abseil logging (used by some Google native deps). 3 ~ FATAL-only
-os.environ.setdefault("ABSL_LOGGING_MIN_LOG_LEVEL", "3")
-# glog compatibility (some builds respect this env var)
-os.environ.setdefault("GLOG_minloglevel", "3")
-# Additional environment variables to suppress Google SDK warnings
-os.environ.setdefault("GOOGLE_CLOUD_DISABLE_GRPC", "true")
-os.environ.setdefault("GRPC_ENABLE_FORK_SUPPORT", "false")
+from collections import OrderedDict
+from contextlib import nullcontext
 
 # Suppress specific warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="google")
 warnings.filterwarnings("ignore", message=".*ALTS.*")
 warnings.filterwarnings("ignore", message=".*log messages before absl::InitializeLog.*")
 
-import google.generativeai as genai
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 from . import config, ui
 
-DEFAULT_MODEL = os.getenv("PAI_MODEL", "gemini-2.5-flash-lite")
-try:
-    DEFAULT_TEMPERATURE = float(os.getenv("PAI_TEMPERATURE", "0.3"))
-    # Clamp temperature to safe range
-    if DEFAULT_TEMPERATURE < 0.0:
-        DEFAULT_TEMPERATURE = 0.0
-    elif DEFAULT_TEMPERATURE > 2.0:
-        DEFAULT_TEMPERATURE = 2.0
-except ValueError:
-    DEFAULT_TEMPERATURE = 0.3
-
-# Global runtime configuration holder
+if TYPE_CHECKING:
+    import google.generativeai as genai
+
+# The genai SDK (gRPC, protobuf, absl) is imported on first use rather than at import time
+_genai = None
+
+def _configure_grpc_env():
+    """Quiet the native gRPC/absl loggers; must run before the SDK is imported."""
+    # Reduce noisy STDERR logs from gRPC/absl before importing Google SDKs.
+    # These settings aim to suppress INFO/WARNING/ERROR logs emitted by native libs
+    # that happen prior to Python log initialization.
+    os.environ.setdefault("GRPC_VERBOSITY", "NONE")
+    os.environ.setdefault("GRPC_LOG_SEVERITY", "ERROR")
+    # Abseil logging (used by some Google native deps). 3 ~ FATAL-only
+    os.environ.setdefault("ABSL_LOGGING_MIN_LOG_LEVEL", "3")
+    # glog compatibility (some builds respect this env var)
+    os.environ.setdefault("GLOG_minloglevel", "3")
+    # Additional environment variables to suppress Google SDK warnings
+    os.environ.setdefault("GOOGLE_CLOUD_DISABLE_GRPC", "true")
+    os.environ.setdefault("GRPC_ENABLE_FORK_SUPPORT", "false")
+
+def _get_genai():
+    """Import google.generativeai on first use and return the module."""
+    global _genai
+    if _genai is None:
+        _configure_grpc_env()
+        import google.generativeai as genai
+        _genai = genai
+    return _genai
+
+# Used when neither a CLI flag nor PAI_MODEL / PAI_TEMPERATURE provides a value
+_FALLBACK_MODEL = "gemini-2.5-flash-lite"
+_FALLBACK_TEMPERATURE = 0.3
+
+# Global runtime configuration holder (filled in by set_runtime_model(), at the latest on first use)
 _runtime = {
     "name": None,
     "temperature": None,
@@ -44,30 +58,66 @@ _runtime = {
 def set_runtime_model(model_name: str | None = None, temperature: float | None = None):
     """Configure preferred model name and temperature at runtime.
     
-    The API key will be injected and a fresh GenerativeModel will be 
-    constructed per request in _prepare_runtime().
+    Values not given fall back to the PAI_MODEL / PAI_TEMPERATURE environment
+    variables, then to the built-in defaults. The API key is picked per request
+    in _prepare_runtime(), which reuses a pooled GenerativeModel per key and model;
+    the temperature is sent with each request.
     """
     global _runtime
     try:
-        name = (model_name or DEFAULT_MODEL) or "gemini-2.5-flash-lite"
-        temp = DEFAULT_TEMPERATURE if temperature is None else float(temperature)
+        name = model_name or os.getenv("PAI_MODEL") or _FALLBACK_MODEL
+        if temperature is None:
+            try:
+                temperature = float(os.getenv("PAI_TEMPERATURE", _FALLBACK_TEMPERATURE))
+            except ValueError:
+                temperature = _FALLBACK_TEMPERATURE
         # Clamp temperature to safe range
-        temp = max(0.0, min(2.0, temp))
+        temp = max(0.0, min(2.0, float(temperature)))
         _runtime["name"] = name
         _runtime["temperature"] = temp
     except Exception as e:
         ui.print_error(f"Failed to set runtime model configuration: {e}")
 
-# Set initial defaults
-set_runtime_model(DEFAULT_MODEL, DEFAULT_TEMPERATURE)
+def get_runtime_model() -> tuple[str, float]:
+    """Return the (model name, temperature) that requests are currently made with."""
+    if _runtime["name"] is None:
+        set_runtime_model()
+    return _runtime["name"], _runtime["temperature"]
+
+def _key_fingerprint(api_key: str) -> str:
+    """Short digest identifying an API key, so module state never holds the key itself."""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+# Fingerprint of the API key the genai SDK is currently configured with. genai.configure()
+# drops the SDK's cached service clients, so it is only called again when the key changes.
+_configured_key: Optional[str] = None
 
-def _prepare_runtime() -> tuple[Optional[genai.GenerativeModel], str]:
-    """Configure API key via smart rotation and return a fresh model instance.
+# Models reused across requests, keyed by (key fingerprint, model name), least recently used
+# first. Temperature is passed with each request, so changing it does not need a new model. A
+# model binds the SDK client of the key configured when it is first called and keeps it, so a
+# pooled model stays on its own key (and connection) after later rotations. Models are only
+# pooled once a request succeeded: one whose first call failed may never have bound a client,
+# and would otherwise pick up whichever key is configured next.
+MODEL_POOL_SIZE = 8
+_model_pool: "OrderedDict[tuple[str, str], genai.GenerativeModel]" = OrderedDict()
+
+def _pool_model(pool_key: tuple[str, str], model: "genai.GenerativeModel"):
+    """Remember a model whose first request succeeded, evicting the least recently used."""
+    _model_pool[pool_key] = model
+    if len(_model_pool) > MODEL_POOL_SIZE:
+        _model_pool.popitem(last=False)
+
+def _prepare_runtime() -> tuple[Optional["genai.GenerativeModel"], str, Optional[tuple[str, str]]]:
+    """Select an API key via smart rotation and return a model bound to it.
     
     Returns:
-        Tuple of (model: GenerativeModel | None, key_id: str). 
+        Tuple of (model: GenerativeModel | None, key_id: str, pool_key). 
         If model is None, key_id is empty or describes why it failed.
+        pool_key is set for a newly built model, which the caller pools
+        with _pool_model() once a request on it succeeds; it is None for
+        a model taken from the pool.
     """
+    global _configured_key
     # Use smart key selection (skips blacklisted keys)
     pair = config.get_next_available_key()
     
@@ -83,25 +133,41 @@ def _prepare_runtime() -> tuple[Optional[genai.GenerativeModel], str]:
         else:
             # No keys configured at all
             ui.print_error("Error: No API keys configured. Use `pai config add <ID> <API_KEY>`.")
-        return None, ""
+        return None, "", None
     
     key_id, api_key = pair
     
+    # Client-side pacing (PAI_RPM_PER_KEY): wait for the key's budget rather than risk a 429
+    wait = config.reserve_request(key_id)
+    if wait:
+        ui.print_info(f"⏳ Pacing requests ({config.RPM_PER_KEY:g}/min per key): waiting {wait:.1f} seconds...")
+        time.sleep(wait)
+    
+    name, _ = get_runtime_model()
+    fingerprint = _key_fingerprint(api_key)
+    pool_key = (fingerprint, name)
+    
+    # 1. Reuse the model already built for this key and model name
+    model = _model_pool.get(pool_key)
+    if model is not None:
+        _model_pool.move_to_end(pool_key)
+        return model, key_id, None
+    
     try:
-        # 1. Force fresh configuration of the genai SDK with the selected key
-        genai.configure(api_key=api_key)
-        
-        # 2. Build a COMPLETELY NEW model instance to ensure no internal caching of old keys/state
-        name = _runtime.get("name") or DEFAULT_MODEL
-        temp = _runtime.get("temperature") if _runtime.get("temperature") is not None else DEFAULT_TEMPERATURE
-        generation_config = {"temperature": temp}
+        genai = _get_genai()
+
+        # 2. Configure the genai SDK with the selected key, so the new model binds its client.
+        #    The caller uses the model right away, before any other key is configured
+        if fingerprint != _configured_key:
+            genai.configure(api_key=api_key)
+            _configured_key = fingerprint
         
-        fresh_model = genai.GenerativeModel(name, generation_config=generation_config)
-        return fresh_model, key_id
+        # 3. Build the model for this key; the caller pools it after its first success
+        return genai.GenerativeModel(name), key_id, pool_key
         
     except Exception as e:
         ui.print_error(f"Failed to configure API key '{key_id}': {e}")
-        return None, ""
+        return None, "", None
 
 def _is_rate_limit_error(error: Exception) -> bool:
     """Detect if an exception is a rate limit error.
@@ -125,6 +191,50 @@ def _is_rate_limit_error(error: Exception) -> bool:
     
     return any(keyword in error_msg for keyword in rate_limit_keywords)
 
+def _is_unrecoverable_error(error: Exception) -> bool:
+    """Detect errors that no retry can fix (malformed request, unknown model).
+    
+    Problems with a particular API key are not included: the next key may work.
+    """
+    try:
+        # Part of google-api-core, which the genai SDK depends on (and has imported by now)
+        from google.api_core import exceptions as api_exceptions
+    except ImportError:
+        return False
+    
+    error_msg = str(error).lower()
+    if 'api key' in error_msg or 'api_key' in error_msg:
+        return False
+    
+    return isinstance(error, (api_exceptions.InvalidArgument, api_exceptions.NotFound))
+
+# Retry backoff: base * 2**attempt, stretched by up to 50% random jitter so parallel sessions
+# do not retry in lockstep, and capped
+RATE_LIMIT_BASE_DELAY = 3.0
+ERROR_BASE_DELAY = 1.0
+MAX_RETRY_DELAY = 30.0
+
+def _retry_delay(attempt: int, base: float) -> float:
+    return min(base * (2 ** attempt) * (1 + random.uniform(0, 0.5)), MAX_RETRY_DELAY)
+
+# Opening code fence with an optional language tag. Alternatives are tried in order, so this
+# behaves exactly like checking each prefix with startswith() and stopping at the first hit
+_CODE_BLOCK_PREFIXES = (
+    "```python", "```html", "```css", "```javascript", "```js",
+    "```typescript", "```ts", "```json", "```yaml", "```yml",
+    "```bash", "```sh", "```diff", "```xml", "```sql",
+    "```java", "```cpp", "```c", "```go", "```rust", "```ruby",
+    "```php", "```markdown", "```md", "```text", "```txt", "```"
+)
+_OPEN_FENCE_RE = re.compile("|".join(re.escape(prefix) for prefix in _CODE_BLOCK_PREFIXES))
+
+# Bare language tags that sometimes appear on their own first line
+_LANGUAGE_TAG_LINES = frozenset({
+    'html', 'css', 'javascript', 'js', 'python', 'json', 'yaml', 
+    'bash', 'sh', 'diff', 'xml', 'sql', 'java', 'cpp', 'c', 'go', 
+    'rust', 'ruby', 'php', 'markdown', 'md', 'text', 'txt', 'on'
+})
+
 def _clean_response_text(text: str) -> str:
     """Clean markdown artifacts from LLM response.
     
@@ -136,32 +246,20 @@ def _clean_response_text(text: str) -> str:
     """
     cleaned_text = text.strip()
     
-    # Remove all common markdown code block patterns
-    code_block_prefixes = [
-        "```python", "```html", "```css", "```javascript", "```js",
-        "```typescript", "```ts", "```json", "```yaml", "```yml",
-        "```bash", "```sh", "```diff", "```xml", "```sql",
-        "```java", "```cpp", "```c", "```go", "```rust", "```ruby",
-        "```php", "```markdown", "```md", "```text", "```txt", "```"
-    ]
-    
-    for prefix in code_block_prefixes:
-        if cleaned_text.startswith(prefix):
-            cleaned_text = cleaned_text[len(prefix):].strip()
-            break
+    # Remove the leading code block marker (with its language tag, if any)
+    match = _OPEN_FENCE_RE.match(cleaned_text)
+    if match:
+        cleaned_text = cleaned_text[match.end():].strip()
     
     # Remove trailing code block markers
     if cleaned_text.endswith("```"):
         cleaned_text = cleaned_text[:-len("```")].strip()
     
-    # Remove any remaining language tags at the start
-    lines = cleaned_text.split('\n')
-    if lines and len(lines[0].strip()) < 20 and lines[0].strip().lower() in [
-        'html', 'css', 'javascript', 'js', 'python', 'json', 'yaml', 
-        'bash', 'sh', 'diff', 'xml', 'sql', 'java', 'cpp', 'c', 'go', 
-        'rust', 'ruby', 'php', 'markdown', 'md', 'text', 'txt', 'on'
-    ]:
-        cleaned_text = '\n'.join(lines[1:]).strip()
+    # Remove any remaining language tag on the first line (only the first line is split off)
+    first_line, _, rest = cleaned_text.partition('\n')
+    first_line = first_line.strip()
+    if len(first_line) < 20 and first_line.lower() in _LANGUAGE_TAG_LINES:
+        cleaned_text = rest.strip()
     
     return cleaned_text
 
@@ -183,11 +281,12 @@ def generate_text(prompt: str, max_retries: int = 3) -> str:
         The cleaned response text, or empty string if all retries failed
     """
     
+    _, temperature = get_runtime_model()
     for attempt in range(max_retries):
-        # Prepare runtime with next available key and get a fresh model instance
-        fresh_model, current_key_id = _prepare_runtime()
+        # Prepare runtime with next available key and get its model
+        model, current_key_id, pool_key = _prepare_runtime()
         
-        if fresh_model is None:
+        if model is None:
             # No keys available (all blacklisted or not configured)
             return ""
         
@@ -197,8 +296,13 @@ def generate_text(prompt: str, max_retries: int = 3) -> str:
             if attempt > 0:
                 status_msg = f"[bold yellow]Retrying with different API key... (attempt {attempt + 1}/{max_retries})"
             
-            with ui.console.status(status_msg, spinner="dots"):
-                response = fresh_model.generate_content(prompt)
+            # The spinner redraws from a background thread; skip it when nobody is watching a terminal
+            with ui.console.status(status_msg, spinner="dots") if ui.IS_TTY else nullcontext():
+                response = model.generate_content(prompt, generation_config={"temperature": temperature})
+            
+            # The model has now bound its client to this key, so it can be reused
+            if pool_key is not None:
+                _pool_model(pool_key, model)
             
             # Success! Clean and return the response
             cleaned_text = _clean_response_text(response.text)
@@ -219,9 +323,10 @@ def generate_text(prompt: str, max_retries: int = 3) -> str:
                 
                 if attempt < max_retries - 1:
                     # Try next key with delay to avoid cascade blacklisting
+                    delay = _retry_delay(attempt, RATE_LIMIT_BASE_DELAY)
                     ui.print_warning(f"⚠ Rate limit detected on key '{current_key_id}'. Switching to next API key...")
-                    ui.print_info("⏳ Waiting 3 seconds to avoid cascade rate limiting...")
-                    time.sleep(3)  # Delay to prevent cascade blacklisting
+                    ui.print_info(f"⏳ Waiting {delay:.1f} seconds to avoid cascade rate limiting...")
+                    time.sleep(delay)  # Delay to prevent cascade blacklisting
                     continue
                 else:
                     # Final attempt failed
@@ -231,9 +336,14 @@ def generate_text(prompt: str, max_retries: int = 3) -> str:
                 # Non-rate-limit error (e.g., network issue, invalid prompt)
                 ui.print_error(f"Error: LLM API issue: {e}")
                 
-                # For non-rate-limit errors, retry once more if we have attempts left
+                # A malformed request or unknown model fails the same way on every attempt
+                if _is_unrecoverable_error(e):
+                    return ""
+                
+                # For other errors (network, server), back off and retry if we have attempts left
                 if attempt < max_retries - 1:
-                    ui.print_warning("Retrying with same key...")
+                    ui.print_warning("Retrying...")
+                    time.sleep(_retry_delay(attempt, ERROR_BASE_DELAY))
                     continue
                 else:
                     return ""
@@ -1,8 +1,8 @@
 # paicode/ui.py
 
+import os
 from rich.console import Console
 from rich.panel import Panel
-from rich.syntax import Syntax
 from rich.theme import Theme
 from rich.rule import Rule
 from rich.box import ROUNDED
@@ -22,6 +22,10 @@ custom_theme = Theme({
 # Create a single console instance to be used across the application
 console = Console(theme=custom_theme)
 
+# Panels are only worth rendering for a human at a terminal; piped output or
+# PAI_QUIET=1 falls back to plain titled output
+IS_TTY = console.is_terminal and not os.getenv("PAI_QUIET")
+
 def print_success(message: str):
     """Displays a success message with a checkmark icon."""
     console.print(f"[success]✓ {message}[/success]")
@@ -45,13 +49,22 @@ def print_action(message: str):
 def display_panel(content: str, title: str, language: str = None):
     """Displays content within a panel, with optional syntax highlighting."""
     if language:
-        # Use Syntax for code highlighting
+        # Use Syntax for code highlighting (imported lazily; it pulls in Pygments)
+        from rich.syntax import Syntax
         display_content = Syntax(content, language, theme="monokai", line_numbers=True)
     else:
         display_content = content
     
     console.print(Panel(display_content, title=f"[bold grey50]{title}[/bold grey50]", border_style="grey50", expand=False))
 
+def print_panel(renderable, title: str, border_style: str = "grey50", padding=(1, 2)):
+    """Displays a renderable inside a rounded panel, or plainly under its title when not on a terminal."""
+    if IS_TTY:
+        console.print(Panel(renderable, title=title, box=ROUNDED, border_style=border_style, padding=padding))
+    else:
+        console.print(title)
+        console.print(renderable)
+
 def print_rule(title: str):
     """Displays a horizontal rule with a title."""
     console.print(Rule(f"[bold]{title}[/bold]", style="grey50"))
@@ -79,19 +79,21 @@ def tree_directory(path: str = '.') -> str:
     tree_lines = [f"{os.path.basename(full_path)}/"]
 
     def build_tree(directory, prefix=""):
+        # scandir exposes the entry type from the directory listing itself,
+        # so telling files from directories needs no extra stat per item
         try:
-            items = sorted([item for item in os.listdir(directory) if item not in SENSITIVE_PATTERNS])
+            with os.scandir(directory) as it:
+                entries = sorted((entry for entry in it if entry.name not in SENSITIVE_PATTERNS), key=lambda entry: entry.name)
         except FileNotFoundError:
             return
 
-        pointers = ['├── '] * (len(items) - 1) + ['└── ']
+        pointers = ['├── '] * (len(entries) - 1) + ['└── ']
         
-        for pointer, item in zip(pointers, items):
-            tree_lines.append(f"{prefix}{pointer}{item}")
-            item_path = os.path.join(directory, item)
-            if os.path.isdir(item_path):
+        for pointer, entry in zip(pointers, entries):
+            tree_lines.append(f"{prefix}{pointer}{entry.name}")
+            if entry.is_dir():
                 extension = '│   ' if pointer == '├── ' else '    '
-                build_tree(item_path, prefix=prefix + extension)
+                build_tree(entry.path, prefix=prefix + extension)
 
     build_tree(full_path)
     return "\n".join(tree_lines)
@@ -0,0 +1,45 @@
+import pytest
+
+from paicode import agent, config, llm, workspace
+
+
+@pytest.fixture(autouse=True)
+def isolated_config(tmp_path, monkeypatch):
+    """Point the credentials store and WRITE cache at a throwaway directory."""
+    config_dir = tmp_path / "config"
+    monkeypatch.setenv("PAI_CONFIG_DIR", str(config_dir))
+    monkeypatch.setattr(config, "_config_dir", None)
+    monkeypatch.setattr(config, "_key_file", None)
+    monkeypatch.setattr(config, "_dir_ready", False)
+    monkeypatch.setattr(config, "_store_cache", None)
+    monkeypatch.setattr(config, "_rotation_dirty", False)
+    monkeypatch.setattr(config, "_buckets", {})
+    monkeypatch.setattr(agent, "_write_cache_conn", None)
+    monkeypatch.setattr(agent, "_write_cache_enabled", True)
+    agent._written_paths.clear()
+    agent._integrity_cache.clear()
+    yield config_dir
+    if agent._write_cache_conn is not None:
+        agent._write_cache_conn.close()
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """A fresh project root for the workspace helpers, with an empty read cache."""
+    root = tmp_path / "project"
+    root.mkdir()
+    monkeypatch.setattr(workspace, "PROJECT_ROOT", str(root))
+    monkeypatch.chdir(root)
+    agent._READ_CACHE.clear()
+    return root
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """Script llm.generate_text: fake_llm(*replies) returns the list of prompts it receives."""
+    def script(*responses):
+        prompts = []
+        replies = iter(responses)
+        monkeypatch.setattr(llm, "generate_text", lambda prompt: prompts.append(prompt) or next(replies))
+        return prompts
+    return script
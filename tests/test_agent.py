@@ -0,0 +1,107 @@
+import pytest
+
+from paicode import agent, workspace
+
+
+def test_undecodable_read_does_not_abort_step(project):
+    (project / "a.bin").write_bytes(b"\xff\xfe\x00binary")
+    (project / "b.txt").write_text("hello\n")
+
+    _, log = agent._generate_execution_renderables("READ::a.bin\nREAD::b.txt")
+
+    assert "An exception occurred while processing 'READ::a.bin'" in log
+    assert "Content of b.txt:\n---\nhello\n" in log
+
+
+def test_prefetch_only_covers_leading_read_only_commands(project, monkeypatch):
+    (project / "a.txt").write_text("a\n")
+    calls = []
+    read_file = workspace.read_file
+    monkeypatch.setattr(workspace, "read_file", lambda path: calls.append(path) or read_file(path))
+
+    _, log = agent._generate_execution_renderables("READ::a.txt\nREAD::b.txt\nTOUCH::n.txt\nREAD::n.txt")
+
+    # n.txt is only read once TOUCH has created it, not speculatively before
+    assert calls.count("n.txt") == 1
+    assert "Content of n.txt:" in log
+
+
+def test_unsafe_prefetched_read_is_reported_once(project, capsys):
+    agent._generate_execution_renderables("READ::../outside.txt\nREAD::b.txt")
+
+    assert capsys.readouterr().out.count("outside the project directory") == 1
+
+
+def test_session_log_closed_when_loop_raises(project, monkeypatch):
+    opened, closed = [], []
+    real_open, real_close = agent.os.open, agent.os.close
+
+    def tracking_open(path, *args):
+        fd = real_open(path, *args)
+        if str(path).endswith(".log"):
+            opened.append(fd)
+        return fd
+
+    def tracking_close(fd):
+        closed.append(fd)
+        real_close(fd)
+
+    monkeypatch.setattr(agent.os, "open", tracking_open)
+    monkeypatch.setattr(agent.os, "close", tracking_close)
+    monkeypatch.setattr(agent.signal, "signal", lambda *args: None)
+    monkeypatch.setattr(agent, "PROMPT_TOOLKIT_AVAILABLE", False)
+    monkeypatch.setattr(agent.Prompt, "ask", lambda *args, **kwargs: "hello")
+    monkeypatch.setattr(workspace, "get_system_capabilities", lambda: "")
+
+    def broken_classifier(*args):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(agent, "_classify_intent", broken_classifier)
+
+    with pytest.raises(RuntimeError):
+        agent.start_interactive_session()
+
+    assert len(opened) == 1 and opened[0] in closed
+
+
+@pytest.mark.parametrize("has_writev", [True, False])
+def test_append_log_writes_entry_and_separator(tmp_path, monkeypatch, has_writev):
+    if not has_writev:
+        monkeypatch.delattr(agent.os, "writev")
+    log_path = tmp_path / "session.log"
+    fd = agent.os.open(log_path, agent.os.O_WRONLY | agent.os.O_APPEND | agent.os.O_CREAT, 0o644)
+    try:
+        agent._append_log(fd, "first")
+        agent._append_log(fd, "second")
+    finally:
+        agent.os.close(fd)
+
+    assert log_path.read_bytes() == b"first" + agent._LOG_SEPARATOR + b"second" + agent._LOG_SEPARATOR
+
+
+@pytest.mark.parametrize("plan", ["```\n```", "```python\n```", "```\n  ```"])
+def test_empty_fenced_plan_leaves_no_fence_line(plan):
+    _, log = agent._generate_execution_renderables(plan)
+    assert "```" not in log
+
+
+def test_fenced_plan_keeps_its_lines(project):
+    (project / "a.txt").write_text("a\n")
+    _, log = agent._generate_execution_renderables("```text\nREAD::a.txt\n```")
+    assert "```" not in log
+    assert "Content of a.txt:" in log
+
+
+def test_json_loads_falls_back_for_non_finite_numbers():
+    assert agent._json_loads('{"score": Infinity, "passed": true}') == {"score": float("inf"), "passed": True}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("* first\n- second\n+ third", "first\nsecond\nthird"),
+    ("  * indented  \n\t- tabbed", "indented\ntabbed"),
+    ("**bold** point\n1. numbered", "bold point\n1. numbered"),
+    ("*not a marker\n-5 degrees\n- ", "*not a marker\n-5 degrees\n-"),
+    ("", ""),
+])
+def test_clean_markdown_formatting(text, expected):
+    assert agent._clean_markdown_formatting(text) == expected
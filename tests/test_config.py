@@ -0,0 +1,116 @@
+import pytest
+
+from paicode import config
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A controllable monotonic clock for the pacing buckets."""
+    now = [1000.0]
+    monkeypatch.setattr(config.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def two_keys():
+    config.add_api_key("a", "a" * 12)
+    config.add_api_key("b", "b" * 12)
+
+
+def test_round_robin_skips_blacklisted_keys(two_keys):
+    assert [config.get_next_available_key()[0] for _ in range(3)] == ["a", "b", "a"]
+    config.blacklist_key("a", 100)
+    assert [config.get_next_available_key()[0] for _ in range(2)] == ["b", "b"]
+    config.blacklist_key("b", 100)
+    assert config.get_next_available_key() is None
+
+
+def test_pacing_disabled_never_waits(two_keys, monkeypatch):
+    monkeypatch.setattr(config, "RPM_PER_KEY", 0.0)
+    assert all(config.reserve_request("a") == 0.0 for _ in range(100))
+
+
+def test_pacing_spends_budget_then_returns_wait(two_keys, monkeypatch, clock):
+    monkeypatch.setattr(config, "RPM_PER_KEY", 6.0)
+    assert [config.reserve_request("a") for _ in range(6)] == [0.0] * 6
+    # The seventh request has to wait for one token: 60 / 6 seconds
+    assert config.reserve_request("a") == pytest.approx(10.0)
+    # ...and the one after that for a second token
+    assert config.reserve_request("a") == pytest.approx(20.0)
+
+    clock[0] += 20.0
+    assert config.reserve_request("a") == pytest.approx(10.0)
+
+
+def test_rotation_prefers_keys_with_budget(two_keys, monkeypatch, clock):
+    monkeypatch.setattr(config, "RPM_PER_KEY", 1.0)
+    picks = []
+    for _ in range(3):
+        key_id, _ = config.get_next_available_key()
+        picks.append((key_id, config.reserve_request(key_id)))
+    # a and b each have one request; the third goes to the key that refills first, with a wait
+    assert picks[:2] == [("a", 0.0), ("b", 0.0)]
+    assert picks[2][0] == "a" and picks[2][1] == pytest.approx(60.0)
+
+
+def test_rate_limited_key_budget_is_drained(two_keys, monkeypatch, clock):
+    monkeypatch.setattr(config, "RPM_PER_KEY", 6.0)
+    config.reserve_request("a")
+    config.blacklist_key("a", 0)
+    assert config.reserve_request("a") == pytest.approx(10.0)
+
+
+def test_key_ids_reject_any_whitespace():
+    for bad in ("", "a b", "a\tb", "a\rb", "a b"):
+        config.add_api_key(bad, "x" * 12)
+    assert config.list_api_keys() == []
+
+
+def test_store_is_reread_when_the_file_changes(two_keys):
+    assert config.get_default_key_id() == "a"
+    config._get_key_file().write_bytes(b'{"keys": {"z": "zzzzzzzzzzzz"}, "default": "z"}')
+    assert config.get_default_key_id() == "z"
+
+
+def test_json_helpers_accept_what_the_stdlib_accepts():
+    value = config._json_loads('{"x": NaN}')["x"]
+    assert value != value
+    assert config._json_loads(b'{"x": -Infinity}') == {"x": float("-inf")}
+    # Serialising an integer wider than 64 bits falls back to the stdlib encoder
+    assert config._json_dumps({"n": 2 ** 70}) == b'{"n":1180591620717411303424}'
+
+
+def test_unchanged_store_is_not_reread(two_keys, monkeypatch):
+    config._load_store()
+    reads = []
+    read_bytes = config.Path.read_bytes
+    monkeypatch.setattr(config.Path, "read_bytes", lambda self: reads.append(self) or read_bytes(self))
+    for _ in range(3):
+        config.get_default_key_id()
+    assert reads == []
+
+
+def test_rotation_cursor_is_flushed_at_exit(two_keys):
+    config.get_next_available_key()
+    assert config._rotation_dirty
+    config._flush_rotation()
+    assert config._json_loads(config._get_key_file().read_bytes())["rr_index"] == 1
+
+
+def test_rotation_flush_skips_a_store_changed_by_another_process(two_keys):
+    config.get_next_available_key()
+    config._get_key_file().write_bytes(b'{"keys": {"z": "zzzzzzzzzzzz"}, "order": ["z"], "rr_index": 0}')
+    config._flush_rotation()
+    assert config._json_loads(config._get_key_file().read_bytes())["order"] == ["z"]
+
+
+def test_save_replaces_a_stale_temp_file_with_a_private_one(isolated_config):
+    isolated_config.mkdir()
+    stale = isolated_config / "credentials.tmp"
+    stale.write_text("leftover")
+    stale.chmod(0o644)
+
+    config.add_api_key("a", "key-a-123456")
+
+    assert not stale.exists()
+    assert config._get_key_file().stat().st_mode & 0o777 == 0o600
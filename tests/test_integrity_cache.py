@@ -0,0 +1,25 @@
+from paicode import agent
+
+
+def test_parsed_verdict_is_reused(fake_llm):
+    prompts = fake_llm('{"passed": true, "quality_score": 9}')
+    first = agent._run_integrity_check("check step 1")
+    second = agent._run_integrity_check("check step 1")
+    assert first == second == {"passed": True, "quality_score": 9}
+    assert len(prompts) == 1
+
+
+def test_unparseable_reply_is_not_cached(fake_llm):
+    prompts = fake_llm("not json", '["a list"]', '{"passed": false}')
+    assert agent._run_integrity_check("check step 1") is None
+    assert agent._run_integrity_check("check step 1") is None
+    assert agent._run_integrity_check("check step 1") == {"passed": False}
+    assert len(prompts) == 3
+
+
+def test_cache_is_bounded(monkeypatch, fake_llm):
+    monkeypatch.setattr(agent, "INTEGRITY_CACHE_SIZE", 2)
+    fake_llm(*['{"passed": true}'] * 3)
+    for n in range(3):
+        agent._run_integrity_check(f"check step {n}")
+    assert len(agent._integrity_cache) == 2
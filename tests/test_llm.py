@@ -0,0 +1,170 @@
+import types
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+from paicode import config, llm
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("```python\nprint(1)\n```", "print(1)"),
+    ("```\nplain\n```", "plain"),
+    ("```javascript\nlet a;\n```", "let a;"),
+    # "```js" is tried before "```json", as the old prefix loop did; the leftover "on" line is dropped
+    ("```json\n{}\n```", "{}"),
+    ("html\n<p>hi</p>", "<p>hi</p>"),
+    ("no fences here", "no fences here"),
+    ("  ```text\nkeep\nlines\n```  ", "keep\nlines"),
+])
+def test_clean_response_text(text, expected):
+    assert llm._clean_response_text(text) == expected
+
+
+class FakeModel:
+    """Stands in for genai.GenerativeModel; replies (or raises) from a shared script."""
+
+    def __init__(self, sdk, name):
+        self.sdk = sdk
+        self.name = name
+        self.key = sdk.configured_key
+
+    def generate_content(self, prompt, generation_config=None):
+        self.sdk.calls.append((self.key, self.name, generation_config))
+        reply = self.sdk.script.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return types.SimpleNamespace(text=reply)
+
+
+class FakeSDK:
+    def __init__(self):
+        self.configured_key = None
+        self.configures = 0
+        self.built = 0
+        self.calls = []
+        self.script = []
+
+    def configure(self, api_key):
+        self.configures += 1
+        self.configured_key = api_key
+
+    def GenerativeModel(self, name):
+        self.built += 1
+        return FakeModel(self, name)
+
+
+@pytest.fixture
+def sdk(monkeypatch):
+    fake = FakeSDK()
+    monkeypatch.setattr(llm, "_genai", fake)
+    monkeypatch.setattr(llm, "_configured_key", None)
+    monkeypatch.setattr(llm, "_model_pool", llm.OrderedDict())
+    monkeypatch.setattr(llm, "_runtime", {"name": "model-a", "temperature": 0.3})
+    return fake
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(llm.time, "sleep", recorded.append)
+    return recorded
+
+
+@pytest.fixture
+def keys():
+    config.add_api_key("a", "key-a-123456")
+    config.add_api_key("b", "key-b-123456")
+
+
+def test_unrecoverable_error_classification():
+    assert llm._is_unrecoverable_error(api_exceptions.InvalidArgument("Request contains an invalid argument."))
+    assert llm._is_unrecoverable_error(api_exceptions.NotFound("models/nope is not found"))
+    # A bad key is worth retrying: the next key may be fine
+    assert not llm._is_unrecoverable_error(api_exceptions.InvalidArgument("API key not valid."))
+    assert not llm._is_unrecoverable_error(api_exceptions.ServiceUnavailable("try again"))
+    assert not llm._is_unrecoverable_error(ValueError("anything else"))
+
+
+def test_retry_delay_is_jittered_exponential_and_capped(monkeypatch):
+    monkeypatch.setattr(llm.random, "uniform", lambda low, high: low)
+    assert [llm._retry_delay(n, 1.0) for n in range(3)] == [1.0, 2.0, 4.0]
+    monkeypatch.setattr(llm.random, "uniform", lambda low, high: high)
+    assert [llm._retry_delay(n, 1.0) for n in range(3)] == [1.5, 3.0, 6.0]
+    assert llm._retry_delay(10, 3.0) == llm.MAX_RETRY_DELAY
+
+
+def test_unrecoverable_error_is_not_retried(sdk, sleeps, keys):
+    sdk.script = [api_exceptions.NotFound("models/model-a is not found"), "unused"]
+    assert llm.generate_text("hi") == ""
+    assert len(sdk.calls) == 1 and sleeps == []
+
+
+def test_transient_error_backs_off_then_succeeds(sdk, sleeps, keys):
+    sdk.script = [api_exceptions.ServiceUnavailable("unavailable"), "ok"]
+    assert llm.generate_text("hi") == "ok"
+    assert len(sleeps) == 1 and 1.0 <= sleeps[0] <= 1.5
+
+
+def test_rate_limit_blacklists_key_and_moves_on(sdk, sleeps, keys):
+    sdk.script = [api_exceptions.ResourceExhausted("429 quota exceeded"), "ok"]
+    assert llm.generate_text("hi") == "ok"
+    assert [key for key, _, _ in sdk.calls] == ["key-a-123456", "key-b-123456"]
+    assert "a" in config.get_blacklist_status()
+    assert len(sleeps) == 1 and 3.0 <= sleeps[0] <= 4.5
+
+
+def test_models_are_pooled_per_key_and_model(sdk, sleeps, keys):
+    sdk.script = ["1", "2", "3", "4"]
+    for _ in range(4):
+        llm.generate_text("hi")
+    # One model (and one configure) per key; rotating back reuses the model bound to that key
+    assert sdk.built == 2 and sdk.configures == 2
+    assert [key for key, _, _ in sdk.calls] == ["key-a-123456", "key-b-123456"] * 2
+
+
+def test_temperature_change_reuses_the_model(sdk, sleeps, keys):
+    sdk.script = ["1", "2", "3"]
+    llm.generate_text("hi")
+    llm.generate_text("hi")
+    llm.set_runtime_model("model-a", 1.1)
+    llm.generate_text("hi")
+    assert sdk.built == 2
+    assert [generation_config for _, _, generation_config in sdk.calls] == [{"temperature": 0.3}] * 2 + [{"temperature": 1.1}]
+
+
+def test_model_change_builds_a_new_model(sdk, sleeps, keys):
+    sdk.script = ["1", "2", "3"]
+    llm.generate_text("hi")
+    llm.generate_text("hi")
+    llm.set_runtime_model("model-b", None)
+    llm.generate_text("hi")
+    assert sdk.built == 3
+    assert sdk.calls[-1][:2] == ("key-a-123456", "model-b")
+
+
+def test_pool_is_bounded(sdk, sleeps, keys, monkeypatch):
+    monkeypatch.setattr(llm, "MODEL_POOL_SIZE", 1)
+    sdk.script = ["1", "2"]
+    llm.generate_text("hi")
+    llm.generate_text("hi")
+    assert list(llm._model_pool) == [(llm._key_fingerprint("key-b-123456"), "model-a")]
+
+
+def test_pool_holds_no_plaintext_keys(sdk, sleeps, keys):
+    sdk.script = ["1", "2"]
+    llm.generate_text("hi")
+    llm.generate_text("hi")
+    assert len(llm._model_pool) == 2
+    assert not any("key-" in fingerprint for fingerprint, _ in llm._model_pool)
+    assert "key-" not in llm._configured_key
+
+
+def test_model_whose_first_call_failed_is_not_pooled(sdk, sleeps, keys):
+    sdk.script = [api_exceptions.ServiceUnavailable("unavailable"), "ok", "again"]
+    llm.generate_text("hi")
+    assert list(llm._model_pool) == [(llm._key_fingerprint("key-b-123456"), "model-a")]
+
+    # Key a gets a freshly built model rather than the one that failed
+    llm.generate_text("hi")
+    assert sdk.built == 3
+    assert sdk.calls[-1][0] == "key-a-123456"
@@ -0,0 +1,47 @@
+import pytest
+
+from paicode import agent
+
+
+def _legacy_parse(line):
+    """The partition-based classification the compiled regex replaced."""
+    command, _, params = line.partition("::")
+    command = command.upper().strip()
+    return (command, params) if command in agent.VALID_COMMANDS else None
+
+
+def _parse(line):
+    match = agent._CMD_RE.fullmatch(line)
+    return (match.group(1).upper(), match.group(2) or "") if match else None
+
+
+@pytest.mark.parametrize("line", [
+    "READ::src/app.py",
+    "read::src/app.py",
+    "READ ::src/app.py",
+    "WRITE::a.py::print hello :: twice",
+    "MV::a.txt::b.txt",
+    "DIAGNOSE",
+    "FINISH::done",
+    "LIST_PATH::.",
+    "LIST::.",
+    "RUN::ls",
+    "READING::x",
+    "Plain explanation text",
+    "MODIFY::a.py::line one\nline two",
+])
+def test_command_regex_matches_legacy_classification(line):
+    assert _parse(line) == _legacy_parse(line)
+
+
+def test_has_valid_command():
+    assert agent._has_valid_command("Let me look first.\n  READ::a.py  ")
+    assert agent._has_valid_command("DIAGNOSE")
+    assert not agent._has_valid_command("RUN::ls\nI will read the file next.")
+    assert not agent._has_valid_command("")
+    assert not agent._has_valid_command(None)
+
+
+def test_unknown_commands_are_reported_not_run(project):
+    _, log = agent._generate_execution_renderables("RUN::rm -rf build")
+    assert "Ignored unknown commands: RUN::rm -rf build" in log
@@ -0,0 +1,50 @@
+import os
+
+from paicode import agent, workspace
+
+
+def _count_reads(monkeypatch):
+    calls = []
+    read_file = workspace.read_file
+    monkeypatch.setattr(workspace, "read_file", lambda path: calls.append(path) or read_file(path))
+    return calls
+
+
+def test_unchanged_file_is_served_from_memory(project, monkeypatch):
+    (project / "a.txt").write_text("one\n")
+    calls = _count_reads(monkeypatch)
+
+    assert agent._read_file_cached("a.txt") == "one\n"
+    assert agent._read_file_cached("./a.txt") == "one\n"
+    assert calls == ["a.txt"]
+
+
+def test_changed_file_is_read_again(project, monkeypatch):
+    path = project / "a.txt"
+    path.write_text("one\n")
+    calls = _count_reads(monkeypatch)
+    agent._read_file_cached("a.txt")
+
+    path.write_text("three\n")
+    assert agent._read_file_cached("a.txt") == "three\n"
+    assert len(calls) == 2
+
+
+def test_agent_edits_invalidate_even_with_identical_stamp(project, monkeypatch):
+    path = project / "a.txt"
+    path.write_text("one\n")
+    agent._read_file_cached("a.txt")
+    st = os.stat(path)
+
+    path.write_text("two\n")
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    agent._forget_read("./a.txt")
+    assert agent._read_file_cached("a.txt") == "two\n"
+
+
+def test_cache_is_bounded(project, monkeypatch):
+    monkeypatch.setattr(agent, "READ_CACHE_SIZE", 2)
+    for name in ("a", "b", "c"):
+        (project / name).write_text(name)
+        agent._read_file_cached(name)
+    assert list(agent._READ_CACHE) == ["b", "c"]
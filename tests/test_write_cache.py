@@ -0,0 +1,69 @@
+from paicode import agent, workspace
+
+
+def test_successful_write_is_reused_by_a_later_session(project, fake_llm):
+    prompts = fake_llm("print('hi')\n")
+    assert agent.handle_write("app.py", "app.py::print hi").startswith("Success:")
+
+    agent._written_paths.clear()  # a new session
+    (project / "app.py").unlink()
+    assert agent.handle_write("app.py", "app.py::print hi").startswith("Success:")
+
+    assert len(prompts) == 1
+    assert (project / "app.py").read_text() == "print('hi')\n"
+
+
+def test_failed_write_is_not_cached(project, fake_llm):
+    prompts = fake_llm("bad\n", "good\n")
+    # A directory in the way makes the write fail
+    (project / "app.py").mkdir()
+    assert agent.handle_write("app.py", "app.py::content").startswith("Error:")
+
+    (project / "app.py").rmdir()
+    assert agent.handle_write("app.py", "app.py::content").startswith("Success:")
+
+    assert len(prompts) == 2
+    assert (project / "app.py").read_text() == "good\n"
+
+
+def test_rewrite_in_same_session_bypasses_cache(project, fake_llm):
+    prompts = fake_llm("first\n", "second\n")
+    agent.handle_write("app.py", "app.py::content")
+    agent.handle_write("app.py", "app.py::content")
+    assert len(prompts) == 2
+    assert (project / "app.py").read_text() == "second\n"
+
+
+def test_edited_target_is_not_overwritten_from_cache(project, fake_llm):
+    prompts = fake_llm("generated\n", "regenerated\n")
+    (project / "app.py").write_text("original\n")
+    agent.handle_write("app.py", "app.py::content")
+
+    agent._written_paths.clear()  # a new session, after the user edited the file
+    (project / "app.py").write_text("edited by the user\n")
+    agent.handle_write("app.py", "app.py::content")
+
+    assert len(prompts) == 2
+    assert (project / "app.py").read_text() == "regenerated\n"
+
+
+def test_cache_is_not_shared_between_projects(project, tmp_path, monkeypatch, fake_llm):
+    prompts = fake_llm("first project\n", "second project\n")
+    agent.handle_write("main.py", "main.py::entry point")
+
+    other = tmp_path / "other"
+    other.mkdir()
+    monkeypatch.setattr(workspace, "PROJECT_ROOT", str(other))
+    agent._written_paths.clear()
+    agent.handle_write("main.py", "main.py::entry point")
+
+    assert len(prompts) == 2
+    assert (other / "main.py").read_text() == "second project\n"
+
+
+def test_cache_lives_in_the_private_config_dir(project, isolated_config, fake_llm):
+    fake_llm("x = 1\n")
+    agent.handle_write("app.py", "app.py::content")
+
+    assert (isolated_config / "write_cache.db").exists()
+    assert isolated_config.stat().st_mode & 0o777 == 0o700